@@ -0,0 +1,15 @@
+import shutil
+import tempfile
+
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def yatube_test_settings(django_test_environment):
+    """Тестовые настройки yatube на всю сессию pytest (см. core.testing)."""
+    from core.testing import test_settings
+
+    directory = tempfile.mkdtemp(prefix='yatube-test-')
+    with test_settings(directory):
+        yield
+    shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core import metrics
+
+
+class Command(BaseCommand):
+    help = 'Показывает накопленные счётчики производительности.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prefix', default='',
+            help='Показывать только счётчики с этим префиксом.')
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить показанные счётчики.')
+
+    def handle(self, *args, **options):
+        values = metrics.snapshot(options['prefix'])
+        if not values:
+            self.stdout.write('Счётчиков пока нет.')
+        width = max(map(len, values), default=0)
+        for name, value in values.items():
+            self.stdout.write(f'{name.ljust(width)}  {value}')
+        if options['reset']:
+            metrics.reset(options['prefix'])
@@ -0,0 +1,88 @@
+"""Простые счётчики работы приложения.
+
+Значения лежат в кэше по умолчанию, поэтому при общем кэше их видят все
+процессы. Посмотреть текущие значения: `python manage.py show_metrics`.
+
+Чтобы счётчики не добавляли записей в кэш на каждый запрос, приращения
+копятся в памяти процесса и сбрасываются в кэш не чаще раза в
+METRICS_FLUSH_INTERVAL секунд, а также при завершении процесса и перед
+чтением значений.
+"""
+import atexit
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+PREFIX = 'metrics:'
+NAMES_KEY = PREFIX + 'names'
+
+_pending = Counter()
+_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def incr(name, value=1):
+    """Увеличивает счётчик `name` на `value`."""
+    if not value:
+        return
+    with _lock:
+        _pending[name] += value
+        due = (time.monotonic() - _flushed_at
+               >= settings.METRICS_FLUSH_INTERVAL)
+    if due:
+        flush()
+
+
+def flush():
+    """Переносит накопленные в процессе приращения в кэш."""
+    global _flushed_at
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    pending = {name: value for name, value in pending.items() if value}
+    if not pending:
+        return
+    names = cache.get(NAMES_KEY, set())
+    if not names.issuperset(pending):
+        cache.set(NAMES_KEY, names | set(pending), None)
+    for name, value in pending.items():
+        key = PREFIX + name
+        if cache.add(key, value, None):
+            continue
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.set(key, value, None)
+
+
+atexit.register(flush)
+
+
+def get(name):
+    flush()
+    return cache.get(PREFIX + name, 0)
+
+
+def snapshot(prefix=''):
+    """Словарь {имя: значение} для счётчиков, начинающихся с `prefix`."""
+    flush()
+    names = sorted(
+        name for name in cache.get(NAMES_KEY, set())
+        if name.startswith(prefix)
+    )
+    values = cache.get_many([PREFIX + name for name in names])
+    return {name: values.get(PREFIX + name, 0) for name in names}
+
+
+def reset(prefix=''):
+    with _lock:
+        for name in [name for name in _pending if name.startswith(prefix)]:
+            del _pending[name]
+    names = cache.get(NAMES_KEY, set())
+    dropped = {name for name in names if name.startswith(prefix)}
+    cache.delete_many([PREFIX + name for name in dropped])
+    cache.set(NAMES_KEY, names - dropped, None)
@@ -0,0 +1,175 @@
+import codecs
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+from django.views.static import serve
+
+from . import metrics
+from .minify import Minifier, minify
+from .queries import QueryRecorder, check_budget
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def accepts_gzip(request):
+    return bool(re_accepts_gzip.search(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+
+class QueryBudgetMiddleware:
+    """Считает SQL-запросы каждого view и сверяет их с QUERY_BUDGETS.
+
+    Отчёт сохраняется в `request.query_report`, чтобы его могли
+    проверить тесты.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        request.query_report = recorder
+        match = request.resolver_match
+        if match is not None:
+            check_budget(recorder, match.view_name)
+        return response
+
+
+class StaticFilesMiddleware:
+    """Отдаёт собранную статику из STATIC_ROOT.
+
+    Файлы с хэшем в имени (см. core.staticfiles) кэшируются навсегда с
+    `immutable`, остальные — на STATIC_MAX_AGE секунд. Клиенту, который
+    принимает gzip, отдаётся заранее сжатая копия. При DEBUG статику
+    раздаёт runserver, и до этого middleware запросы не доходят.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        prefix = settings.STATIC_URL
+        if (settings.STATIC_ROOT and request.method in ('GET', 'HEAD')
+                and request.path.startswith(prefix)):
+            response = self.serve(request, request.path[len(prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        root = settings.STATIC_ROOT
+        if not os.path.isfile(os.path.join(root, name)):
+            return None
+        path = name
+        compressed = f'{name}.gz'
+        if accepts_gzip(request) and os.path.isfile(
+                os.path.join(root, compressed)):
+            path = compressed
+        response = serve(request, path, document_root=root)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if getattr(staticfiles_storage, 'is_hashed', None) and (
+                staticfiles_storage.is_hashed(name)):
+            patch_cache_control(
+                response, public=True, max_age=365 * 24 * 60 * 60,
+                immutable=True)
+        else:
+            patch_cache_control(
+                response, public=True, max_age=settings.STATIC_MAX_AGE)
+        return response
+
+
+class CompressionMiddleware:
+    """Сжимает пробелы в HTML (см. core.minify) и отдаёт ответы в gzip.
+
+    Работает и с потоковыми ответами: они сжимаются по мере отдачи.
+    Не трогает ответы, у которых уже есть Content-Encoding, типы не из
+    COMPRESS_CONTENT_TYPES (картинки и архивы уже сжаты) и ответы
+    короче COMPRESS_MIN_SIZE байт. Для каждого view считает исходный
+    размер ответов и сэкономленные байты: счётчики
+    `compression.<view>.bytes` и `compression.<view>.saved`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if (response.has_header('Content-Encoding')
+                or not content_type.startswith(
+                    settings.COMPRESS_CONTENT_TYPES)
+                or not response.streaming
+                and len(response.content) < settings.COMPRESS_MIN_SIZE):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        gzip = accepts_gzip(request)
+        html = settings.HTML_MINIFY and content_type == 'text/html'
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'other'
+        if response.streaming:
+            self.compress_stream(response, view, html, gzip)
+        else:
+            self.compress(response, view, html, gzip)
+        if gzip:
+            # Сжатое тело уже не совпадает байт в байт: сильный ETag
+            # становится слабым (RFC 7232, раздел 2.1).
+            etag = response.get('ETag')
+            if etag and etag.startswith('"'):
+                response['ETag'] = 'W/' + etag
+        return response
+
+    def compress(self, response, view, html, gzip):
+        original = content = response.content
+        if html:
+            content = minify(content.decode(response.charset)).encode(
+                response.charset)
+        if gzip:
+            compressed = compress_string(content)
+            if len(compressed) < len(content):
+                content = compressed
+                response['Content-Encoding'] = 'gzip'
+        if len(content) < len(original):
+            response.content = content
+            response['Content-Length'] = str(len(content))
+        self.count(view, len(original), len(response.content))
+
+    def compress_stream(self, response, view, html, gzip):
+        sizes = {'original': 0, 'sent': 0}
+
+        def measure(chunks, key):
+            for chunk in chunks:
+                sizes[key] += len(chunk)
+                yield chunk
+
+        def minified(chunks):
+            decoder = codecs.getincrementaldecoder(response.charset)()
+            minifier = Minifier()
+            for chunk in chunks:
+                text = minifier.feed(decoder.decode(chunk))
+                if text:
+                    yield text.encode(response.charset)
+            yield (minifier.feed(decoder.decode(b'', final=True))
+                   + minifier.flush()).encode(response.charset)
+
+        def counted(chunks):
+            yield from chunks
+            self.count(view, sizes['original'], sizes['sent'])
+
+        chunks = measure(response.streaming_content, 'original')
+        if html:
+            chunks = minified(chunks)
+        if gzip:
+            chunks = compress_sequence(chunks)
+            response['Content-Encoding'] = 'gzip'
+        response.streaming_content = counted(measure(chunks, 'sent'))
+        # Итоговый размер известен только после отдачи.
+        del response['Content-Length']
+
+    def count(self, view, original, sent):
+        metrics.incr(f'compression.{view}.bytes', original)
+        metrics.incr(f'compression.{view}.saved', original - sent)
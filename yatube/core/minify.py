@@ -0,0 +1,70 @@
+"""Безопасное сжатие пробелов в HTML.
+
+Шаблоны дают много отступов: каждая строка разметки начинается с
+десятков пробелов. Здесь любая последовательность пробельных символов,
+в которой есть перевод строки, заменяется одним переводом строки. Для
+браузера это тот же пробел, поэтому текст и вёрстка не меняются, а
+пробелы внутри строки (между словами, в атрибутах) не трогаются вовсе.
+Содержимое <pre>, <textarea>, <script> и <style> остаётся как есть.
+
+Minifier работает по кускам, чтобы сжимать и потоковые ответы: хвост
+куска, который может продолжиться в следующем (незакрытый <pre>,
+начало тега, пробелы в конце), он придерживает до следующего вызова.
+"""
+import re
+
+_INDENT = re.compile(r'[ \t\r\f]*\n\s*')
+_PRESERVED = re.compile(r'<(pre|textarea|script|style)\b', re.I)
+
+
+def _collapse(text):
+    return _INDENT.sub('\n', text)
+
+
+class Minifier:
+    def __init__(self):
+        self._buffer = ''
+
+    def feed(self, text):
+        """Сжатый HTML, который уже можно отдать, из очередного куска."""
+        return self._process(self._buffer + text, final=False)
+
+    def flush(self):
+        """Остаток, придержанный предыдущими вызовами `feed`."""
+        return self._process(self._buffer, final=True)
+
+    def _process(self, text, final):
+        result = []
+        position = 0
+        while True:
+            match = _PRESERVED.search(text, position)
+            if match is None:
+                break
+            closing = re.compile(r'</%s\s*>' % match.group(1), re.I)
+            end = closing.search(text, match.end())
+            if end is None and not final:
+                # Блок закроется в одном из следующих кусков.
+                break
+            result.append(_collapse(text[position:match.start()]))
+            position = end.end() if end is not None else len(text)
+            result.append(text[match.start():position])
+        rest = text[position:]
+        keep = len(rest)
+        if not final and match is None:
+            # Пробелы в конце и недописанный тег могут продолжиться в
+            # следующем куске.
+            keep = len(rest.rstrip())
+            tag = rest.rfind('<', 0, keep)
+            if tag != -1 and '>' not in rest[tag:keep]:
+                keep = tag
+        elif not final:
+            keep = match.start() - position
+        result.append(_collapse(rest[:keep]))
+        self._buffer = rest[keep:]
+        return ''.join(result)
+
+
+def minify(html):
+    """Сжатый HTML целиком."""
+    minifier = Minifier()
+    return minifier.feed(html) + minifier.flush()
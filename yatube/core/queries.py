@@ -0,0 +1,73 @@
+"""Учёт SQL-запросов, которые выполняет один view.
+
+QueryRecorder подключается к соединению через `execute_wrapper` и
+собирает число запросов, суммарное время в БД и «формы» SQL — текст
+запроса без параметров. Форма, повторённая много раз за один запрос
+к сайту, почти всегда означает N+1.
+"""
+import logging
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[sql] += 1
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._wrapper.__exit__(*exc_info)
+
+    def repeated(self, limit=None):
+        """Формы SQL, выполненные `limit` раз и больше."""
+        if limit is None:
+            limit = settings.QUERY_REPEAT_LIMIT
+        return {sql: n for sql, n in self.shapes.items() if n >= limit}
+
+    def problems(self, view_name):
+        """Список нарушений бюджета для view `view_name`."""
+        problems = []
+        budget = settings.QUERY_BUDGETS.get(view_name)
+        if budget is not None and self.count > budget:
+            problems.append(
+                f'{view_name}: {self.count} запросов при бюджете {budget}')
+        for sql, n in self.repeated().items():
+            problems.append(f'{view_name}: запрос повторён {n} раз: {sql}')
+        return problems
+
+
+def check_budget(recorder, view_name):
+    """Пишет нарушения в лог или, в строгом режиме, бросает исключение."""
+    problems = recorder.problems(view_name)
+    logger.debug('%s: %s запросов, %.1f мс в БД', view_name,
+                 recorder.count, recorder.duration * 1000)
+    if not problems:
+        return
+    if settings.QUERY_BUDGET_STRICT:
+        raise QueryBudgetExceeded('\n'.join(problems))
+    for problem in problems:
+        logger.warning(problem)
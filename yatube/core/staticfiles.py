@@ -0,0 +1,61 @@
+"""Статика с хэшем содержимого в имени и сжатыми копиями.
+
+collectstatic сохраняет каждый файл ещё и под именем с хэшем
+(css/bootstrap.min.5a1b….css), пишет манифест staticfiles.json и рядом
+с текстовыми файлами кладёт их gzip-копии (*.gz). Манифест читается
+один раз при создании хранилища, поэтому {% static %} получает имя с
+хэшем из памяти. Имя с хэшем меняется вместе с содержимым, так что
+такие файлы можно кэшировать навсегда (см. StaticFilesMiddleware).
+
+Если collectstatic ещё не запускали или файла нет в манифесте,
+{% static %} отдаёт обычное имя вместо ошибки.
+"""
+import gzip
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def is_hashed(self, name):
+        """Есть ли `name` среди имён с хэшем из манифеста."""
+        if not hasattr(self, '_hashed_names'):
+            self._hashed_names = set(self.hashed_files.values())
+        return name in self._hashed_names
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        self._hashed_names = set(self.hashed_files.values())
+        for name in sorted(set(paths) | self._hashed_names):
+            if self.compress(name):
+                yield name, f'{name}.gz', True
+
+    def compress(self, name):
+        """Пишет gzip-копию `name`, если она заметно меньше файла."""
+        extension = os.path.splitext(name)[1].lower()
+        if extension not in settings.STATIC_GZIP_EXTENSIONS:
+            return False
+        with self.open(name) as source:
+            content = source.read()
+        if len(content) < settings.STATIC_GZIP_MIN_SIZE:
+            return False
+        # mtime=0: одинаковый файл всегда даёт одинаковую копию.
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) >= len(content) * 0.95:
+            return False
+        if self.exists(f'{name}.gz'):
+            self.delete(f'{name}.gz')
+        self._save(f'{name}.gz', ContentFile(compressed))
+        return True
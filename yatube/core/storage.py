@@ -0,0 +1,95 @@
+"""Хранилище, которое называет файлы по их содержимому.
+
+Имя файла — SHA-256 содержимого внутри каталога, который задаёт
+upload_to: одинаковые загрузки попадают в один файл, а у sorl для него
+один набор миниатюр. Сколько полей ссылаются на файл, хранит StoredFile:
+save() добавляет ссылку, delete() снимает её, а сам файл удаляется,
+когда ссылок не остаётся. Файлы, сохранённые до этого хранилища, в
+StoredFile не записаны и delete() не удаляет.
+
+save() сначала пишет файл, а ссылку добавляет в текущей транзакции —
+той же, что сохраняет модель, поэтому откат сохранения откатывает и
+ссылку. release() удаляет файл, только если сам удалил последнюю
+ссылку, и делает это до коммита, пока держит блокировку записи.
+Ссылка, добавленная в это время другим запросом, ждёт коммита, после
+чего save() видит, что файла нет, и пишет его заново.
+"""
+import hashlib
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .models import StoredFile
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        """Имя по содержимому: каталог/ab/cdef….расширение."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        hexdigest = digest.hexdigest()
+        extension = posixpath.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), hexdigest[:2], hexdigest[2:] + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        self._write(name, content)
+        self.retain(name)
+        if not self.exists(name):
+            # Последнюю ссылку на тот же файл сняли между записью и
+            # retain(): release() успел удалить файл.
+            content.seek(0)
+            self._write(name, content)
+        return name
+
+    def _write(self, name, content):
+        if self.exists(name):
+            return
+        saved = self._save(name, content)
+        if saved != name:
+            # Тот же файл одновременно записал другой запрос.
+            super().delete(saved)
+
+    def retain(self, name):
+        files = StoredFile.objects.filter(name=name)
+        if files.update(references=F('references') + 1):
+            return
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, references=1)
+        except IntegrityError:
+            # Запись одновременно создал другой запрос.
+            files.update(references=F('references') + 1)
+
+    def release(self, name):
+        """Снимает ссылку; True, если она была последней и файл удалён."""
+        files = StoredFile.objects.filter(name=name)
+        while True:
+            with transaction.atomic():
+                deleted, _ = files.filter(references__lte=1).delete()
+                if deleted:
+                    super().delete(name)
+                    return True
+                if files.filter(references__gt=1).update(
+                        references=F('references') - 1):
+                    return False
+                if not files.exists():
+                    return False
+            # Между запросами число ссылок изменил другой запрос.
+
+    def delete(self, name):
+        self.release(name)
+
+
+content_storage = ContentAddressedStorage()
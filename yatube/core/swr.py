@@ -0,0 +1,66 @@
+"""Кэш с мягким и жёстким сроком (stale-while-revalidate).
+
+Запись хранится вместе с версией и моментом мягкого истечения. Пока
+версия совпадает и мягкий срок не прошёл, запись отдаётся как есть.
+Устаревшую запись (истёк мягкий срок или сменилась версия) обновляет
+только тот запрос, который взял блокировку через `cache.add`; остальные
+в это время получают старую копию. Жёсткий срок на SWR_STALE_TIMEOUT
+дольше мягкого: столько устаревшая копия может служить заменой.
+
+Если копии нет совсем, запросы ждут блокировку не дольше SWR_LOCK_WAIT
+и затем считают значение сами, чтобы не зависеть от упавшего процесса.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import metrics
+
+LOCK_PREFIX = 'swr:lock:'
+
+
+def _refresh(key, version, compute, timeout, cacheable):
+    value = compute()
+    if cacheable is None or cacheable(value):
+        fresh_until = time.time() + timeout
+        cache.set(key, (version, fresh_until, value),
+                  timeout + settings.SWR_STALE_TIMEOUT)
+    metrics.incr('swr.refreshes')
+    return value
+
+
+def get_or_refresh(key, compute, timeout, version=None, cacheable=None):
+    """Значение `key` из кэша; при необходимости пересчитывает его.
+
+    `compute()` вызывается без аргументов. `cacheable(value)` решает,
+    сохранять ли посчитанное значение (по умолчанию — всегда).
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        entry_version, fresh_until, value = entry
+        if entry_version == version and time.time() < fresh_until:
+            return value
+    lock = LOCK_PREFIX + key
+    if cache.add(lock, 1, settings.SWR_LOCK_TIMEOUT):
+        try:
+            return _refresh(key, version, compute, timeout, cacheable)
+        finally:
+            cache.delete(lock)
+    if entry is not None:
+        metrics.incr('swr.stale')
+        return entry[2]
+    metrics.incr('swr.lock_waits')
+    deadline = time.monotonic() + settings.SWR_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(settings.SWR_LOCK_POLL)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[2]
+        if cache.add(lock, 1, settings.SWR_LOCK_TIMEOUT):
+            try:
+                return _refresh(key, version, compute, timeout, cacheable)
+            finally:
+                cache.delete(lock)
+    metrics.incr('swr.lock_timeouts')
+    return compute()
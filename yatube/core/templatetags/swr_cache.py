@@ -0,0 +1,56 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from core import swr
+
+register = template.Library()
+
+
+class SWRCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, vary_on, version):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.version = version
+
+    def render(self, context):
+        try:
+            timeout = int(self.timeout.resolve(context))
+        except (TypeError, ValueError, template.VariableDoesNotExist):
+            raise template.TemplateSyntaxError(
+                f'"swrcache": неверный срок {self.timeout.token!r}')
+        key = make_template_fragment_key(
+            self.fragment_name,
+            [var.resolve(context) for var in self.vary_on])
+        version = (self.version.resolve(context)
+                   if self.version is not None else None)
+        return swr.get_or_refresh(
+            key, lambda: self.nodelist.render(context), timeout, version)
+
+
+@register.tag
+def swrcache(parser, token):
+    """Как {% cache %}, но отдаёт устаревшую копию, пока её обновляют.
+
+    {% swrcache timeout fragment_name [var ...] [version=var] %}
+
+    Копия с другой `version` считается устаревшей: её обновляет один
+    запрос, остальные в это время получают старую.
+    """
+    nodelist = parser.parse(('endswrcache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    version = None
+    if len(bits) > 3 and bits[-1].startswith('version='):
+        version = parser.compile_filter(bits.pop()[len('version='):])
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f'"{bits[0]}" требует срок и имя фрагмента')
+    return SWRCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:]],
+        version,
+    )
@@ -0,0 +1,63 @@
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+def test_settings(directory):
+    """override_settings для тестов: свой файл кэша в `directory`.
+
+    Кэш и счётчики сразу видны всем процессам, а миниатюры готовятся
+    прямо в вызвавшем потоке, чтобы тесты не ждали пул.
+    """
+    caches = copy.deepcopy(settings.CACHES)
+    caches['default']['LOCATION'] = os.path.join(directory, 'cache.sqlite3')
+    caches['default'].setdefault('OPTIONS', {})['SYNC_INTERVAL'] = 0
+    return override_settings(CACHES=caches, POST_THUMBNAIL_WORKERS=0,
+                             METRICS_FLUSH_INTERVAL=0)
+
+
+class TestRunner(DiscoverRunner):
+    """`manage.py test` с тестовыми настройками из test_settings."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.directory = tempfile.mkdtemp(prefix='yatube-test-')
+        self.test_settings = test_settings(self.directory)
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetTestMixin:
+    """Проверки отчёта QueryBudgetMiddleware для TestCase."""
+
+    def assertWithinQueryBudget(self, response):
+        report = response.wsgi_request.query_report
+        view_name = response.wsgi_request.resolver_match.view_name
+        self.assertIn(view_name, settings.QUERY_BUDGETS,
+                      f'Для {view_name} не задан бюджет запросов')
+        self.assertEqual(report.problems(view_name), [])
+
+
+class OnCommitTestMixin:
+    """Для TestCase: выполняет колбэки transaction.on_commit.
+
+    Тест целиком идёт в одной транзакции, поэтому без коммита такие
+    колбэки копятся до конца теста и не выполняются вовсе.
+    """
+
+    def run_on_commit(self):
+        while connection.run_on_commit:
+            callbacks = [func for _, func in connection.run_on_commit]
+            connection.run_on_commit = []
+            for func in callbacks:
+                func()
@@ -1,6 +1,29 @@
+import gzip
+import os
+import shutil
+import tempfile
 from http import HTTPStatus
+from unittest import mock
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db import transaction
+from django.template import Context, Template
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.utils.text import compress_string
+
+from core import metrics, swr
+from core.middleware import CompressionMiddleware
+from core.minify import Minifier, minify
+from core.models import StoredFile
+from core.storage import ContentAddressedStorage
+from core.testing import test_settings
+from core.tiered_cache import L1, TieredCache
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +31,326 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+@override_settings(SWR_LOCK_WAIT=0.1, SWR_LOCK_POLL=0.01)
+class TestSettingsTests(SimpleTestCase):
+    def test_cache_lives_in_given_directory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with test_settings(directory):
+            location = settings.CACHES['default']['LOCATION']
+            cache.set('key', 'value')
+            self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(os.path.dirname(location), directory)
+        self.assertTrue(os.path.exists(location))
+        self.assertNotEqual(settings.CACHES['default']['LOCATION'], location)
+
+
+class StaleWhileRevalidateTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fresh_value_is_not_recomputed(self):
+        swr.get_or_refresh('key', lambda: 'first', 60)
+        self.assertEqual(swr.get_or_refresh('key', lambda: 'second', 60),
+                         'first')
+
+    def test_new_version_refreshes(self):
+        swr.get_or_refresh('key', lambda: 'first', 60, version=1)
+        self.assertEqual(
+            swr.get_or_refresh('key', lambda: 'second', 60, version=2),
+            'second')
+
+    def test_stale_copy_served_while_locked(self):
+        """Пока запись обновляет другой процесс, отдаётся старая копия."""
+        swr.get_or_refresh('key', lambda: 'first', 60, version=1)
+        cache.add(swr.LOCK_PREFIX + 'key', 1)
+        self.assertEqual(
+            swr.get_or_refresh('key', lambda: 'second', 60, version=2),
+            'first')
+        self.assertEqual(metrics.get('swr.stale'), 1)
+
+    def test_missing_copy_waits_for_lock(self):
+        """Без копии запрос ждёт блокировку, а затем считает сам."""
+        cache.add(swr.LOCK_PREFIX + 'key', 1)
+        self.assertEqual(swr.get_or_refresh('key', lambda: 'value', 60),
+                         'value')
+        self.assertEqual(metrics.get('swr.lock_waits'), 1)
+        self.assertEqual(metrics.get('swr.lock_timeouts'), 1)
+
+    def test_template_tag(self):
+        tmpl = Template(
+            '{% load swr_cache %}'
+            '{% swrcache 60 fragment key version=version %}'
+            '{{ value }}{% endswrcache %}')
+        render = tmpl.render
+        self.assertEqual(
+            render(Context({'key': 1, 'version': 1, 'value': 'a'})), 'a')
+        self.assertEqual(
+            render(Context({'key': 1, 'version': 1, 'value': 'b'})), 'a')
+        self.assertEqual(
+            render(Context({'key': 1, 'version': 2, 'value': 'b'})), 'b')
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        location = os.path.join(directory, 'cache.sqlite3')
+        params = {'OPTIONS': {'SYNC_INTERVAL': 0, 'L1_MAX_ENTRIES': 2}}
+        self.first = TieredCache(location, params)
+        # Второй экземпляр со своим L1 изображает другой процесс.
+        self.second = TieredCache(location, params)
+        self.second._l1 = L1()
+
+    def test_write_invalidates_other_process(self):
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.set('key', 'new')
+        self.assertEqual(self.second.get('key'), 'new')
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+
+    def test_clear_reaches_other_process(self):
+        self.first.set('key', 'value')
+        self.second.get('key')
+        self.first.clear()
+        self.assertIsNone(self.second.get('key'))
+
+    def test_l1_is_bounded(self):
+        self.first.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(list(self.first._l1.entries),
+                         [':1:b', ':1:c'])
+        self.assertEqual(self.first.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': 2, 'c': 3})
+
+    def test_add_and_incr_are_shared(self):
+        self.assertTrue(self.first.add('lock', 1))
+        self.assertFalse(self.second.add('lock', 1))
+        self.first.incr('lock')
+        self.assertEqual(self.second.incr('lock', 2), 4)
+        with self.assertRaises(ValueError):
+            self.first.incr('missing')
+
+    def test_expired_entries(self):
+        self.first.set('key', 'value', 0)
+        self.assertIsNone(self.second.get('key'))
+        self.assertTrue(self.first.add('key', 'again'))
+
+    def test_unlogged_keys_skip_l1_and_log(self):
+        for cache_ in (self.first, self.second):
+            cache_.unlogged_prefixes = ('metrics:',)
+        self.first.add('metrics:hits', 1)
+        self.first.incr('metrics:hits')
+        self.assertEqual(self.second.get('metrics:hits'), 2)
+        self.assertEqual(dict(self.first._l1.entries), {})
+        self.assertEqual(self.first._db.execute(
+            'SELECT COUNT(*) FROM invalidations').fetchone()[0], 0)
+        self.second.incr('metrics:hits')
+        self.assertEqual(self.first.get('metrics:hits'), 3)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def test_identical_content_shares_one_file(self):
+        first = self.storage.save('posts/a.gif', ContentFile(b'one'))
+        second = self.storage.save('posts/b.GIF', ContentFile(b'one'))
+        other = self.storage.save('posts/c.gif', ContentFile(b'two'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(first.startswith('posts/'))
+        self.assertTrue(first.endswith('.gif'))
+        self.assertEqual(
+            StoredFile.objects.get(name=first).references, 2)
+        self.assertEqual(len(os.listdir(os.path.join(
+            self.location, os.path.dirname(first)))), 1)
+
+    def test_file_removed_with_last_reference(self):
+        name = self.storage.save('posts/a.gif', ContentFile(b'one'))
+        self.storage.save('posts/b.gif', ContentFile(b'one'))
+        self.assertFalse(self.storage.release(name))
+        self.assertTrue(self.storage.exists(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_reference_rolled_back_with_transaction(self):
+        """Ссылка добавляется в транзакции того, кто сохраняет файл."""
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            name = self.storage.save('posts/a.gif', ContentFile(b'one'))
+            raise RuntimeError
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_file_rewritten_after_concurrent_release(self):
+        """Файл, удалённый между записью и ссылкой, пишется заново."""
+        name = self.storage.save('posts/a.gif', ContentFile(b'one'))
+        retain = self.storage.retain
+
+        def release_then_retain(retained):
+            self.assertTrue(self.storage.release(retained))
+            retain(retained)
+
+        with mock.patch.object(self.storage, 'retain', release_then_retain):
+            self.assertEqual(
+                self.storage.save('posts/b.gif', ContentFile(b'one')), name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+
+    def test_release_keeps_file_of_other_reference(self):
+        """Файл удаляет только тот, кто удалил последнюю ссылку."""
+        name = self.storage.save('posts/a.gif', ContentFile(b'one'))
+        StoredFile.objects.filter(name=name).update(references=2)
+        self.assertFalse(self.storage.release(name))
+        self.assertTrue(self.storage.exists(name))
+        self.assertTrue(self.storage.release(name))
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(self.storage.release(name))
+
+    def test_unknown_file_is_kept(self):
+        """Файлы, сохранённые до хранилища, delete() не трогает."""
+        path = os.path.join(self.location, 'old.gif')
+        with open(path, 'wb') as old:
+            old.write(b'old')
+        self.storage.delete('old.gif')
+        self.assertTrue(os.path.exists(path))
+
+
+class StaticFilesTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings = override_settings(STATIC_ROOT=root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.root = root
+
+    def static(self, name):
+        return Template('{% load static %}{% static name %}').render(
+            Context({'name': name}))
+
+    def test_without_collectstatic_plain_name(self):
+        self.assertEqual(self.static('css/bootstrap.min.css'),
+                         '/static/css/bootstrap.min.css')
+
+    def test_collectstatic_hashes_and_compresses(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        url = self.static('css/bootstrap.min.css')
+        self.assertRegex(url, r'^/static/css/bootstrap\.min\.\w{12}\.css$')
+        name = url[len('/static/'):]
+        self.assertTrue(staticfiles_storage.exists(f'{name}.gz'))
+        self.assertFalse(staticfiles_storage.exists('img/logo.png.gz'))
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        response.close()
+
+        response = self.client.get('/static/css/bootstrap.min.css')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertNotIn('immutable', response['Cache-Control'])
+        response.close()
+
+
+PAGE = (
+    '<html>\n    <body>\n        <p>Два  пробела</p>\n'
+    '        <pre>\n    код\n        </pre>\n'
+    '        <textarea>\n\n  текст</textarea>\n    </body>\n</html>\n'
+) * 10
+
+
+@override_settings(METRICS_FLUSH_INTERVAL=60)
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def test_increments_are_buffered(self):
+        with mock.patch.object(cache, 'incr') as incr, \
+                mock.patch.object(cache, 'add') as add:
+            for _ in range(5):
+                metrics.incr('test.hits')
+        incr.assert_not_called()
+        add.assert_not_called()
+        self.assertEqual(metrics.get('test.hits'), 5)
+        metrics.incr('test.hits', 2)
+        self.assertEqual(metrics.snapshot('test.'), {'test.hits': 7})
+
+    def test_flush_interval(self):
+        metrics.incr('test.hits')
+        self.assertIsNone(cache.get(metrics.PREFIX + 'test.hits'))
+        with override_settings(METRICS_FLUSH_INTERVAL=0):
+            metrics.incr('test.hits')
+        self.assertEqual(cache.get(metrics.PREFIX + 'test.hits'), 2)
+
+    def test_reset_drops_pending(self):
+        metrics.incr('test.hits')
+        metrics.incr('other.hits')
+        metrics.reset('test.')
+        self.assertEqual(metrics.snapshot(), {'other.hits': 1})
+
+
+class CompressionTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get(
+            '/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.request.resolver_match = None
+
+    def process(self, response, request=None):
+        return CompressionMiddleware(lambda request: response)(
+            request or self.request)
+
+    def test_minify_keeps_text_and_preformatted_blocks(self):
+        self.assertEqual(
+            minify('<div>\n    <p>Два  слова</p>\n  <pre>\n  a\n</pre>\n'),
+            '<div>\n<p>Два  слова</p>\n<pre>\n  a\n</pre>\n')
+
+    def test_minifier_chunks_give_same_result(self):
+        minifier = Minifier()
+        chunks = [PAGE[i:i + 7] for i in range(0, len(PAGE), 7)]
+        self.assertEqual(
+            ''.join(map(minifier.feed, chunks)) + minifier.flush(),
+            minify(PAGE))
+
+    def test_html_minified_and_compressed(self):
+        response = self.process(HttpResponse(PAGE))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response.content,
+                         compress_string(minify(PAGE).encode()))
+        self.assertEqual(response['Content-Length'],
+                         str(len(response.content)))
+        self.assertEqual(metrics.get('compression.other.bytes'),
+                         len(PAGE.encode()))
+        self.assertEqual(metrics.get('compression.other.saved'),
+                         len(PAGE.encode()) - len(response.content))
+
+    def test_without_gzip_only_minified(self):
+        response = self.process(HttpResponse(PAGE), RequestFactory().get('/'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content.decode(), minify(PAGE))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_streaming_response(self):
+        chunks = (PAGE[i:i + 50].encode() for i in range(0, len(PAGE), 50))
+        response = self.process(StreamingHttpResponse(chunks))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = b''.join(response.streaming_content)
+        self.assertEqual(gzip.decompress(content).decode(), minify(PAGE))
+        self.assertEqual(metrics.get('compression.other.saved'),
+                         len(PAGE.encode()) - len(content))
+
+    def test_skipped_responses(self):
+        encoded = HttpResponse(PAGE)
+        encoded['Content-Encoding'] = 'br'
+        image = HttpResponse(PAGE, content_type='image/png')
+        for response in (encoded, image, HttpResponse('<p>\n  мало</p>')):
+            with self.subTest(content_type=response['Content-Type']):
+                content = response.content
+                self.assertEqual(self.process(response).content, content)
+        self.assertEqual(metrics.snapshot('compression.'), {})
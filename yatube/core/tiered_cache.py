@@ -0,0 +1,338 @@
+"""Двухуровневый кэш: LRU в памяти процесса (L1) перед общим SQLite (L2).
+
+L2 — файл SQLite, который видят все рабочие процессы на машине; L1 —
+небольшой ограниченный LRU внутри процесса, общий для его потоков.
+Каждая запись в L2 добавляет ключ в журнал инвалидаций. Процесс читает
+журнал не чаще раза в SYNC_INTERVAL секунд и выбрасывает из своего L1
+изменённые другими процессами ключи, поэтому запись в одном процессе
+доходит до остальных не позже чем через SYNC_INTERVAL. Записи L1 к тому
+же живут не дольше L1_TIMEOUT.
+
+Ключи, начинающиеся с одного из UNLOGGED_PREFIXES (например, счётчики
+core.metrics), живут только в L2: в L1 не попадают, а их запись не
+пишется в журнал, поэтому не будит синхронизацию остальных процессов.
+
+Параметры OPTIONS: L1_MAX_ENTRIES, L1_TIMEOUT, SYNC_INTERVAL, LOG_SIZE,
+UNLOGGED_PREFIXES, а также стандартные MAX_ENTRIES и CULL_FREQUENCY
+для L2.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Запись журнала, после которой процессы очищают L1 целиком.
+CLEAR = '*'
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)',
+    'CREATE TABLE IF NOT EXISTS invalidations ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL)',
+)
+
+_l1_stores = {}
+_l1_stores_lock = threading.Lock()
+
+
+class L1:
+    """LRU одного процесса и его позиция в журнале инвалидаций."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.last_seen = None
+        self.synced_at = 0.0
+        self.own = set()
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 60))
+        self.sync_interval = float(options.get('SYNC_INTERVAL', 0.5))
+        self.log_size = int(options.get('LOG_SIZE', 10000))
+        self.unlogged_prefixes = tuple(options.get('UNLOGGED_PREFIXES', ()))
+        with _l1_stores_lock:
+            self._l1 = _l1_stores.setdefault(location, L1())
+        self._connection = None
+
+    @property
+    def _db(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.location, timeout=30, isolation_level=None,
+                check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._connection = connection
+        return self._connection
+
+    @contextmanager
+    def _write(self):
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _log(self, db, key):
+        entry_id = db.execute(
+            'INSERT INTO invalidations (key) VALUES (?)', (key,)).lastrowid
+        with self._l1.lock:
+            self._l1.own.add(entry_id)
+        if entry_id % 100 == 0:
+            db.execute('DELETE FROM invalidations WHERE id <= ?',
+                       (entry_id - self.log_size,))
+            self._cull(db)
+
+    def _cull(self, db):
+        db.execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            db.execute(
+                'DELETE FROM cache WHERE rowid IN ('
+                'SELECT rowid FROM cache ORDER BY rowid LIMIT ?)',
+                (count // self._cull_frequency,))
+
+    # L1
+
+    def _sync(self):
+        l1 = self._l1
+        now = time.monotonic()
+        if now - l1.synced_at < self.sync_interval:
+            return
+        if l1.last_seen is None:
+            last_seen = self._db.execute(
+                'SELECT COALESCE(MAX(id), 0) FROM invalidations'
+            ).fetchone()[0]
+            with l1.lock:
+                l1.entries.clear()
+                l1.last_seen = last_seen
+                l1.synced_at = now
+            return
+        rows = self._db.execute(
+            'SELECT id, key FROM invalidations WHERE id > ? ORDER BY id',
+            (l1.last_seen,)).fetchall()
+        with l1.lock:
+            l1.synced_at = now
+            if rows and rows[0][0] != l1.last_seen + 1:
+                # Журнал обрезан дальше нашей позиции: что именно
+                # менялось, уже не узнать.
+                l1.entries.clear()
+                l1.own.clear()
+            for entry_id, key in rows:
+                if entry_id in l1.own:
+                    l1.own.discard(entry_id)
+                elif key == CLEAR:
+                    l1.entries.clear()
+                else:
+                    l1.entries.pop(key, None)
+            if rows:
+                l1.last_seen = rows[-1][0]
+
+    def _l1_get(self, key):
+        l1 = self._l1
+        with l1.lock:
+            entry = l1.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del l1.entries[key]
+                return None
+            l1.entries.move_to_end(key)
+            return value
+
+    def _l1_put(self, key, value, expires):
+        l1_expires = time.time() + self.l1_timeout
+        if expires is not None:
+            l1_expires = min(l1_expires, expires)
+        l1 = self._l1
+        with l1.lock:
+            l1.entries[key] = (l1_expires, value)
+            l1.entries.move_to_end(key)
+            while len(l1.entries) > self.l1_max_entries:
+                l1.entries.popitem(last=False)
+
+    def _l1_pop(self, key):
+        with self._l1.lock:
+            self._l1.entries.pop(key, None)
+
+    # API кэша
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _logged(self, key):
+        """Живёт ли ключ (до make_key) в L1 и пишется ли в журнал."""
+        return not key.startswith(self.unlogged_prefixes)
+
+    def get(self, key, default=None, version=None):
+        logged = self._logged(key)
+        key = self._key(key, version)
+        value = None
+        if logged:
+            self._sync()
+            value = self._l1_get(key)
+        if value is None:
+            row = self._db.execute(
+                'SELECT value, expires FROM cache WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] < time.time()):
+                return default
+            value = row[0]
+            if logged:
+                self._l1_put(key, value, row[1])
+        return pickle.loads(value)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        self._sync()
+        found = {}
+        missing = []
+        for key, original in keys.items():
+            value = self._l1_get(key) if self._logged(original) else None
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            now = time.time()
+            rows = self._db.execute(
+                'SELECT key, value, expires FROM cache WHERE key IN (%s)'
+                % ', '.join('?' * len(missing)), missing).fetchall()
+            for key, value, expires in rows:
+                if expires is None or expires >= now:
+                    found[key] = value
+                    if self._logged(keys[key]):
+                        self._l1_put(key, value, expires)
+        return {keys[key]: pickle.loads(value)
+                for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        logged = self._logged(key)
+        key = self._key(key, version)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        with self._write() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)', (key, value, expires))
+            if logged:
+                self._log(db, key)
+        if logged:
+            self._l1_put(key, value, expires)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            (self._key(key, version),
+             pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             self._logged(key))
+            for key, value in data.items()
+        ]
+        with self._write() as db:
+            db.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                [(key, value, expires) for key, value, _ in rows])
+            for key, _, logged in rows:
+                if logged:
+                    self._log(db, key)
+        for key, value, logged in rows:
+            if logged:
+                self._l1_put(key, value, expires)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        logged = self._logged(key)
+        key = self._key(key, version)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        with self._write() as db:
+            db.execute('DELETE FROM cache WHERE key = ? AND expires < ?',
+                       (key, time.time()))
+            added = db.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)', (key, value, expires)).rowcount == 1
+            if added and logged:
+                self._log(db, key)
+        if added and logged:
+            self._l1_put(key, value, expires)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        logged = self._logged(key)
+        key = self._key(key, version)
+        with self._write() as db:
+            touched = db.execute(
+                'UPDATE cache SET expires = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires >= ?)',
+                (self.get_backend_timeout(timeout), key, time.time())
+            ).rowcount == 1
+            if touched and logged:
+                self._log(db, key)
+        self._l1_pop(key)
+        return touched
+
+    def incr(self, key, delta=1, version=None):
+        logged = self._logged(key)
+        key = self._key(key, version)
+        with self._write() as db:
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires >= ?)',
+                (key, time.time())).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            db.execute('UPDATE cache SET value = ? WHERE key = ?',
+                       (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key))
+            if logged:
+                self._log(db, key)
+        self._l1_pop(key)
+        return value
+
+    def has_key(self, key, version=None):
+        sentinel = object()
+        return self.get(key, sentinel, version=version) is not sentinel
+
+    def delete(self, key, version=None):
+        logged = self._logged(key)
+        key = self._key(key, version)
+        with self._write() as db:
+            db.execute('DELETE FROM cache WHERE key = ?', (key,))
+            if logged:
+                self._log(db, key)
+        self._l1_pop(key)
+
+    def clear(self):
+        with self._write() as db:
+            db.execute('DELETE FROM cache')
+            self._log(db, CLEAR)
+        with self._l1.lock:
+            self._l1.entries.clear()
+
+    def close(self, **kwargs):
+        # Соединение с L2 живёт столько же, сколько поток: открывать файл
+        # заново на каждый запрос дороже, чем держать его открытым.
+        pass
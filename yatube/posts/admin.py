@@ -1,9 +1,103 @@
 from django.contrib import admin
+from django.db import transaction
 
+from . import feed_cache
+from .choices import group_choices
 from .models import Post, Group, Comment, Follow
+from .paginators import EstimatedCountPaginator, admin_scope
+from .search import match_expression, matching
 
 
-class PostAdmin(admin.ModelAdmin):
+class IdFilter(admin.FieldListFilter):
+    """Фильтр по внешнему ключу без списка всех объектов в боковой панели.
+
+    Показывает только выбранный объект и поле для его id; ссылки вида
+    ?post__id__exact=5 работают как у обычного фильтра.
+    """
+    template = 'admin/posts/id_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        self.lookup_kwarg = f'{field_path}__id__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(
+            field, request, params, model, model_admin, field_path)
+        # Остальные параметры списка, чтобы форма фильтра их не теряла.
+        self.hidden_params = [
+            (name, value) for name, value in request.GET.items()
+            if name not in (self.lookup_kwarg, 'p', 'e')
+        ]
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(
+                remove=[self.lookup_kwarg]),
+            'display': 'Все',
+        }
+        if self.lookup_val and self.lookup_val.isdigit():
+            selected = self.field.remote_field.model._default_manager.filter(
+                pk=self.lookup_val).first()
+            yield {
+                'selected': True,
+                'query_string': changelist.get_query_string(
+                    {self.lookup_kwarg: self.lookup_val}),
+                'display': str(selected or self.lookup_val),
+            }
+
+
+class ScalableAdminMixin:
+    """Список, которому не нужны полные COUNT(*) по таблице.
+
+    Число строк оценивает EstimatedCountPaginator, а второй подсчёт без
+    фильтров (show_full_result_count) не выполняется. Добавление, правка
+    и удаление через админку сдвигают поколение модели, и закэшированные
+    числа строк её списков пересчитываются.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def rows_changed(self):
+        transaction.on_commit(
+            lambda: feed_cache.bump(admin_scope(self.model)))
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.rows_changed()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.rows_changed()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        self.rows_changed()
+
+
+class FullTextSearchMixin:
+    """Поиск в админке по индексу FTS5 вместо LIKE '%…%'.
+
+    `search_index` — таблица индекса из posts.search, rowid которой
+    совпадает с первичным ключом модели.
+    """
+    search_index = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        if not match_expression(search_term):
+            return queryset.none(), False
+        return queryset.filter(
+            pk__in=matching(self.search_index, search_term)), False
+
+
+class PostAdmin(ScalableAdminMixin, FullTextSearchMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'text',
@@ -11,11 +105,24 @@ class PostAdmin(admin.ModelAdmin):
         'author',
         'group',
     )
+    list_select_related = ('author', 'group')
     list_editable = ('group',)
     search_fields = ('text',)
-    list_filter = ('pub_date',)
+    search_index = 'posts_post_fts'
+    list_filter = ('pub_date', ('author', IdFilter))
+    autocomplete_fields = ('author',)
     empty_value_display = '-пусто-'
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs)
+        if db_field.name == 'group':
+            # Один закэшированный список на все строки list_editable
+            # вместо запроса групп на каждую строку.
+            empty = [('', formfield.empty_label)]
+            formfield.choices = empty + group_choices()
+        return formfield
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = (
@@ -29,7 +136,8 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableAdminMixin, FullTextSearchMixin,
+                   admin.ModelAdmin):
     list_display = (
         'pk',
         'post',
@@ -37,19 +145,24 @@ class CommentAdmin(admin.ModelAdmin):
         'pub_date',
         'author',
     )
-    search_fields = ('post',)
-    list_filter = ('post',)
+    list_select_related = ('post', 'author')
+    search_fields = ('text',)
+    search_index = 'posts_comment_fts'
+    list_filter = (('post', IdFilter), ('author', IdFilter))
+    autocomplete_fields = ('post', 'author')
     empty_value_display = '-пусто-'
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'user',
         'author',
     )
-    search_fields = ('user',)
-    list_filter = ('user',)
+    list_select_related = ('user', 'author')
+    search_fields = ('=user__username', '=author__username')
+    list_filter = (('user', IdFilter), ('author', IdFilter))
+    autocomplete_fields = ('user', 'author')
     empty_value_display = '-пусто-'
 
 
@@ -0,0 +1,20 @@
+"""Закэшированные списки выбора, общие для админки и сигналов."""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Group
+
+GROUP_CHOICES_KEY = 'admin:group_choices'
+
+
+def group_choices():
+    """Список (id, название) всех групп из кэша.
+
+    Сбрасывается сигналами при сохранении и удалении группы.
+    """
+    choices = cache.get(GROUP_CHOICES_KEY)
+    if choices is None:
+        choices = [(group.pk, str(group))
+                   for group in Group.objects.only('pk', 'title')]
+        cache.set(GROUP_CHOICES_KEY, choices, settings.ADMIN_CHOICES_TIMEOUT)
+    return choices
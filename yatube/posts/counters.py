@@ -0,0 +1,57 @@
+"""Денормализованные счётчики постов, подписок и комментариев."""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+def _shift(field, delta):
+    return Greatest(F(field) + delta, Value(0))
+
+
+def bump_author(user_id, **deltas):
+    """Сдвигает счётчики пользователя: bump_author(1, posts_count=1)."""
+    changes = {field: _shift(field, delta) for field, delta in deltas.items()}
+    updated = AuthorStats.objects.filter(user_id=user_id).update(**changes)
+    # Строки нет только у пользователей, созданных в обход сигналов.
+    # Уменьшать в этом случае нечего: пользователь может быть удалён.
+    if not updated and any(delta > 0 for delta in deltas.values()):
+        AuthorStats.objects.get_or_create(user_id=user_id)
+        AuthorStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(pk=group_id).update(
+            posts_count=_shift('posts_count', delta))
+
+
+def bump_post_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=_shift('comments_count', delta))
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+@transaction.atomic
+def recount():
+    """Пересчитывает все счётчики по фактическим данным."""
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(user_id=pk)
+         for pk in User.objects.filter(stats__isnull=True).values_list(
+             'pk', flat=True)),
+        ignore_conflicts=True,
+    )
+    AuthorStats.objects.update(
+        posts_count=_count(Post.objects, 'author'),
+        followers_count=_count(Follow.objects, 'author'),
+        following_count=_count(Follow.objects, 'user'),
+    )
+    Group.objects.update(posts_count=_count(Post.objects, 'group'))
+    Post.objects.update(comments_count=_count(Comment.objects, 'post'))
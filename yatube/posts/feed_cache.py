@@ -0,0 +1,118 @@
+"""Версионированные ключи кэша лент.
+
+У каждой ленты — главной, группы, профиля, подписок читателя и
+комментариев к посту — есть «поколение»: время её последнего изменения,
+которое хранится в кэше без срока. Версия фрагмента собирается из
+поколений всех лент, от которых фрагмент зависит. Сигналы ничего не удаляют, а
+только сдвигают поколения затронутых лент: фрагмент с прежней версией
+считается устаревшим и обновляется при следующем запросе (см. core.swr).
+Поэтому фрагменты можно хранить долго (FEED_CACHE_TIMEOUT), а правки
+видны сразу.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Follow
+from .timeline import pull_authors
+
+INDEX = 'index'
+
+
+def group(group_id):
+    return f'group:{group_id}'
+
+
+def profile(user_id):
+    return f'profile:{user_id}'
+
+
+def follow(user_id):
+    return f'follow:{user_id}'
+
+
+def comments(post_id):
+    return f'comments:{post_id}'
+
+
+def _key(scope):
+    return f'feed:gen:{scope}'
+
+
+def generations(*scopes):
+    """Поколения лент `scopes`; отсутствующие заводятся текущим временем."""
+    keys = [_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump(*scopes):
+    """Сдвигает поколения лент `scopes`; None пропускаются."""
+    now = time.time()
+    cache.set_many(
+        {_key(scope): now for scope in scopes if scope is not None}, None)
+
+
+def fragment_key(request, scopes, viewer=None):
+    """Постоянная часть ключа фрагмента ленты для текущей страницы.
+
+    `viewer` — то, чем фрагмент отличается для разных читателей
+    (например, видны ли кнопки редактирования); None — ничем.
+    """
+    return ':'.join([
+        *scopes,
+        str(viewer),
+        request.GET.get('page', ''),
+        request.GET.get('cursor', ''),
+    ])
+
+
+def version(scopes):
+    """Версия фрагмента: поколения всех лент, от которых он зависит."""
+    return ':'.join(repr(generation) for generation in generations(*scopes))
+
+
+def context(request, scopes, viewer=None, prefix='feed'):
+    return {
+        f'{prefix}_key': fragment_key(request, scopes, viewer),
+        f'{prefix}_version': version(scopes),
+        'feed_timeout': settings.FEED_CACHE_TIMEOUT,
+    }
+
+
+def author_scopes(author_ids):
+    """Ленты, в которых видны карточки постов авторов `author_ids`.
+
+    Ленты подписчиков добавляются, только если автор раскладывает посты
+    по лентам при публикации; ленты подписчиков авторов, которых
+    подтягивают при чтении, зависят от поколения их профиля.
+    """
+    author_ids = {author_id for author_id in author_ids if author_id}
+    if not author_ids:
+        return []
+    scopes = [INDEX] + [profile(author_id) for author_id in author_ids]
+    pushed = author_ids - pull_authors()
+    if pushed:
+        followers = Follow.objects.filter(
+            author_id__in=pushed).values_list('user_id', flat=True)
+        scopes += [follow(user_id) for user_id in set(followers.iterator())]
+    return scopes
+
+
+def post_changed(post, *group_ids, author_ids=()):
+    """Сдвигает поколения лент, в которых виден пост `post`.
+
+    `author_ids` — прежние авторы поста, если его передали другому.
+    """
+    bump(*author_scopes([post.author_id, *author_ids]),
+         *(group(group_id) for group_id in group_ids if group_id))
+
+
+def group_changed(group_id, author_ids):
+    """Сдвигает ленты с карточками постов группы: в них её название."""
+    bump(group(group_id), *author_scopes(author_ids))
@@ -1,5 +1,6 @@
 from django import forms
 
+from . import profanity, uploads
 from .models import Post, Comment
 
 
@@ -14,6 +15,30 @@ class PostForm(forms.ModelForm):
             'image': 'Картинка',
         }
 
+    def __init__(self, *args, upload_too_large=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        # upload_too_large — BoundedUploadHandler оборвал загрузку.
+        # Слишком большой файл, пришедший без него, не отдаём
+        # ImageField: тот принял бы его за испорченную картинку.
+        self.image_error = uploads.too_large() if upload_too_large else None
+        image = self.files.get('image')
+        if image is not None and self.image_error is None:
+            try:
+                uploads.check_size(image)
+            except forms.ValidationError as error:
+                self.image_error = error
+                self.files = self.files.copy()
+                del self.files['image']
+
+    def clean_image(self):
+        if self.image_error is not None:
+            raise self.image_error
+        image = self.cleaned_data['image']
+        if 'image' not in self.files or not image:
+            return image
+        uploads.check_pixels(image)
+        return uploads.ingest(image)
+
 
 class CommentForm(forms.ModelForm):
 
@@ -22,33 +47,5 @@ class CommentForm(forms.ModelForm):
         fields = ('text',)
 
     def clean_text(self):
-        with open('yatube/posts/bed_author.txt', 'r', encoding='utf-8') as bed:
-            variants = bed.read().split()
-        message = self.cleaned_data['text']
-        # Нашел такой вариант на стеке, разобрался как работает,
-        # вроде более эффективно фильтрует, но мне кажется больше ресурсов ест.
-        # Для подсчета расстояний Левенштейна нашел модуль, но его нужно
-        # устанавливать - не проходят тесты на практикуме.
-        ln = len(variants)
-        filtred_message = ''
-        string = ''
-        pattern = '*'
-        for i in message:
-            string += i
-            string2 = string.lower()
-            flag = 0
-            for j in variants:
-                if string2 not in j:
-                    flag += 1
-                if string2 == j:
-                    filtred_message += pattern * len(string)
-                    flag -= 1
-                    string = ''
-            if flag == ln:
-                filtred_message += string
-                string = ''
-        if string2 != '' and string2 not in variants:
-            filtred_message += string
-        elif string2 != '':
-            filtred_message += pattern * len(string)
-        return filtred_message
+        # Запрещённые слова и их опечатки заменяются звёздочками.
+        return profanity.mask(self.cleaned_data['text'])
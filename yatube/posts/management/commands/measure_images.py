@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def choose(files, need):
+    """Вариант, который браузер возьмёт из srcset для ширины `need`.
+
+    Браузер берёт WebP, если он есть, и самую узкую картинку не уже
+    нужной ширины, а если такой нет — самую широкую.
+    """
+    image_format = thumbnails.WEBP if any(
+        file_format == thumbnails.WEBP for _, file_format in files) else None
+    candidates = sorted(
+        (width, image_file) for (width, file_format), image_file
+        in files.items() if file_format == image_format)
+    for width, image_file in candidates:
+        if width >= need:
+            return image_file
+    return candidates[-1][1]
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает, сколько байт картинок скачивает браузер с '
+            'srcset и WebP и сколько скачивал бы одну основную миниатюру.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, default=100,
+            help='Сколько последних постов с картинками проверить.')
+        parser.add_argument(
+            '--size', default='card', help='Размер из POST_THUMBNAILS.')
+        parser.add_argument(
+            '--viewports', default='360,768,1440',
+            help='Ширины экранов через запятую.')
+        parser.add_argument(
+            '--dpr', type=float, default=1.0,
+            help='Плотность пикселей экрана.')
+
+    def handle(self, *args, **options):
+        try:
+            viewports = [int(width) for width in
+                         options['viewports'].split(',')]
+            main_key = thumbnails.variants(options['size'])[0][:2]
+        except (KeyError, ValueError) as error:
+            raise CommandError(f'Неверный аргумент: {error}')
+        names = list(Post.objects.exclude(image='').order_by(
+            '-pub_date').values_list('image', flat=True)[:options['posts']])
+        files = {
+            name: name_files for name, name_files in
+            thumbnails.variant_files(names, options['size']).items()
+            if main_key in name_files
+        }
+        sizes = {}
+
+        def size_of(image_file):
+            if image_file.name not in sizes:
+                sizes[image_file.name] = image_file.storage.size(
+                    image_file.name)
+            return sizes[image_file.name]
+
+        self.stdout.write(
+            f'Картинок с готовыми миниатюрами: {len(files)} из {len(names)}.')
+        for viewport in viewports:
+            before = after = 0
+            for name_files in files.values():
+                main = name_files[main_key]
+                need = min(viewport, main.width) * options['dpr']
+                before += size_of(main)
+                after += size_of(choose(name_files, need))
+            saving = 1 - after / before if before else 0
+            self.stdout.write(
+                f'{viewport:>5} px: было {before / 1024:.1f} КБ, '
+                f'стало {after / 1024:.1f} КБ (меньше на {saving:.0%})')
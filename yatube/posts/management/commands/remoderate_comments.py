@@ -0,0 +1,64 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.remoderation import remoderate
+
+
+class Command(BaseCommand):
+    help = ('Заново проверяет сохранённые комментарии по текущему '
+            'словарю запрещённых слов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help='Сколько комментариев читать за один запрос.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Сколько процессов проверяют комментарии.')
+        parser.add_argument(
+            '--checkpoint', default=settings.REMODERATION_CHECKPOINT,
+            help='Файл, где хранится id последнего проверенного '
+                 'комментария.')
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с первого комментария, не глядя на '
+                 'контрольную точку.')
+        parser.add_argument(
+            '--fuzzy', action='store_true',
+            help='Маскировать и похожие слова (опечатки, латинские '
+                 'двойники), а не только слова словаря.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать замены: ничего не записывать и не '
+                 'трогать контрольную точку.')
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        dry_run = options['dry_run']
+        if options['restart'] and not dry_run and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        def progress(last_id, checked, changed):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f'id {last_id}: проверено {checked}, изменено {changed}')
+
+        def report(pk, old, new):
+            self.stdout.write(f'id {pk}: {old!r} -> {new!r}')
+
+        checked, changed = remoderate(
+            checkpoint, options['chunk_size'], options['workers'], progress,
+            fuzzy=options['fuzzy'], dry_run=dry_run,
+            report=report if dry_run or options['verbosity'] > 1 else None)
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f'Проверено комментариев: {checked}, '
+                f'будет изменено: {changed}.'))
+            return
+        # Прогон дошёл до конца: следующий начнётся с первого комментария.
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено комментариев: {checked}, изменено: {changed}.'))
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.warmup import warm
+
+
+class Command(BaseCommand):
+    help = ('Заранее рисует в кэш первые страницы главной, самые большие '
+            'группы и профили самых читаемых авторов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages', type=int, default=settings.WARM_CACHE_PAGES,
+            help='Сколько первых страниц главной прогреть.')
+        parser.add_argument(
+            '--groups', type=int, default=settings.WARM_CACHE_GROUPS,
+            help='Сколько групп с наибольшим числом постов прогреть.')
+        parser.add_argument(
+            '--authors', type=int, default=settings.WARM_CACHE_AUTHORS,
+            help='Сколько авторов с наибольшим числом подписчиков прогреть.')
+        parser.add_argument(
+            '--workers', type=int, default=settings.WARM_CACHE_WORKERS,
+            help='Сколько страниц рисовать одновременно.')
+
+    def handle(self, *args, **options):
+        results = warm(options['pages'], options['groups'],
+                       options['authors'], options['workers'])
+        for url, status, seconds in results:
+            self.stdout.write(f'{status}  {seconds * 1000:7.1f} мс  {url}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Прогрето страниц: {len(results)}.'))
@@ -0,0 +1,83 @@
+from django.db import migrations
+
+CREATE_INDEXES = [
+    '''CREATE VIRTUAL TABLE posts_post_fts USING fts5(
+        text,
+        content='posts_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )''',
+    '''CREATE VIRTUAL TABLE posts_comment_fts USING fts5(
+        text, post_id UNINDEXED,
+        content='posts_comment', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )''',
+]
+
+CREATE_TRIGGERS = [
+    '''CREATE TRIGGER posts_post_fts_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO posts_post_fts (rowid, text)
+        VALUES (new.id, new.text);
+    END''',
+    '''CREATE TRIGGER posts_post_fts_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END''',
+    '''CREATE TRIGGER posts_post_fts_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO posts_post_fts (rowid, text)
+        VALUES (new.id, new.text);
+    END''',
+    '''CREATE TRIGGER posts_comment_fts_insert
+    AFTER INSERT ON posts_comment BEGIN
+        INSERT INTO posts_comment_fts (rowid, text, post_id)
+        VALUES (new.id, new.text, new.post_id);
+    END''',
+    '''CREATE TRIGGER posts_comment_fts_delete
+    AFTER DELETE ON posts_comment BEGIN
+        INSERT INTO posts_comment_fts
+            (posts_comment_fts, rowid, text, post_id)
+        VALUES ('delete', old.id, old.text, old.post_id);
+    END''',
+    '''CREATE TRIGGER posts_comment_fts_update
+    AFTER UPDATE OF text, post_id ON posts_comment BEGIN
+        INSERT INTO posts_comment_fts
+            (posts_comment_fts, rowid, text, post_id)
+        VALUES ('delete', old.id, old.text, old.post_id);
+        INSERT INTO posts_comment_fts (rowid, text, post_id)
+        VALUES (new.id, new.text, new.post_id);
+    END''',
+]
+
+REBUILD = [
+    "INSERT INTO posts_post_fts (posts_post_fts) VALUES ('rebuild')",
+    "INSERT INTO posts_comment_fts (posts_comment_fts) VALUES ('rebuild')",
+]
+
+DROP = [
+    'DROP TRIGGER IF EXISTS posts_post_fts_insert',
+    'DROP TRIGGER IF EXISTS posts_post_fts_delete',
+    'DROP TRIGGER IF EXISTS posts_post_fts_update',
+    'DROP TRIGGER IF EXISTS posts_comment_fts_insert',
+    'DROP TRIGGER IF EXISTS posts_comment_fts_delete',
+    'DROP TRIGGER IF EXISTS posts_comment_fts_update',
+    'DROP TABLE IF EXISTS posts_post_fts',
+    'DROP TABLE IF EXISTS posts_comment_fts',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_post_image_storage'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            CREATE_INDEXES + CREATE_TRIGGERS + REBUILD,
+            reverse_sql=DROP,
+        ),
+    ]
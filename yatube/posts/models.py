@@ -1,15 +1,35 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.db.models.query import ValuesListIterable
 from django.db.models.query_utils import Q
 
+from core.storage import content_storage
+
 User = get_user_model()
 
+# Колонки, которые нужны карточке поста в ленте (includes/posts.html).
+FEED_FIELDS = (
+    'id', 'text', 'pub_date', 'image',
+    'author', 'author__username', 'author__first_name', 'author__last_name',
+    'group', 'group__slug', 'group__title',
+)
+ROW_FIELDS = (
+    'id', 'text', 'pub_date', 'image',
+    'author_id', 'author__username', 'author__first_name',
+    'author__last_name', 'group_id', 'group__slug', 'group__title',
+)
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(
+        'Число постов',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ('title',)
@@ -20,6 +40,82 @@ class Group(models.Model):
         return self.title[:settings.NUM_OF_STR]
 
 
+class AuthorRow:
+    __slots__ = ('id', 'username', 'first_name', 'last_name')
+
+    def __init__(self, id, username, first_name, last_name):
+        self.id = id
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+
+    def get_full_name(self):
+        return f'{self.first_name} {self.last_name}'.strip()
+
+    def __str__(self):
+        return self.username
+
+
+class GroupRow:
+    __slots__ = ('id', 'slug', 'title')
+
+    def __init__(self, id, slug, title):
+        self.id = id
+        self.slug = slug
+        self.title = title
+
+    def __str__(self):
+        return self.title[:settings.NUM_OF_STR]
+
+
+class FeedRow:
+    """Облегчённая строка ленты вместо экземпляра Post."""
+    __slots__ = ('id', 'text', 'pub_date', 'image',
+                 'author_id', 'author', 'group_id', 'group')
+
+    def __init__(self, id, text, pub_date, image, author_id,
+                 username, first_name, last_name,
+                 group_id, group_slug, group_title):
+        self.id = id
+        self.text = text
+        self.pub_date = pub_date
+        self.image = image
+        self.author_id = author_id
+        self.author = AuthorRow(author_id, username, first_name, last_name)
+        self.group_id = group_id
+        self.group = (
+            GroupRow(group_id, group_slug, group_title)
+            if group_id is not None else None
+        )
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.text[:settings.NUM_OF_STR]
+
+
+class FeedRowIterable(ValuesListIterable):
+    def __iter__(self):
+        for values in super().__iter__():
+            yield FeedRow(*values)
+
+
+class PostQuerySet(models.QuerySet):
+    def feed(self, rows=False):
+        """Посты для ленты: только нужные карточке колонки.
+
+        Автор и группа присоединяются одним запросом. С `rows=True`
+        вместо моделей возвращаются компактные FeedRow.
+        """
+        if rows:
+            queryset = self.values_list(*ROW_FIELDS)
+            queryset._iterable_class = FeedRowIterable
+            return queryset
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста',
@@ -48,11 +144,25 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=content_storage,
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_feed_idx'),
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_feed_idx'),
+        ]
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
 
@@ -85,6 +195,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['post', 'pub_date'],
+                         name='comment_post_feed_idx'),
+        ]
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
 
@@ -113,3 +227,75 @@ class Follow(models.Model):
             models.CheckConstraint(check=~Q(user='author'),
                                    name='user_following')
         ]
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок: строка на пару читатель-пост.
+
+    Заполняется при публикации поста (fan-out on write), поэтому страница
+    «Избранных авторов» читается одним проходом по индексу
+    (user, pub_date, post) без соединения Follow и Post.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи ленты"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='timeline_unique_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'pub_date', 'post'],
+                         name='timeline_feed_idx'),
+            models.Index(fields=['user', 'author', 'pub_date'],
+                         name='timeline_author_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class AuthorStats(models.Model):
+    """Счётчики пользователя, которые показываются в профиле.
+
+    Поддерживаются сигналами при создании и удалении постов и подписок,
+    пересчитываются командой `manage.py recount_counters`.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0, db_index=True)
+    following_count = models.PositiveIntegerField(
+        'Число подписок', default=0)
+
+    class Meta:
+        verbose_name = "Счётчики автора"
+        verbose_name_plural = "Счётчики авторов"
+
+    def __str__(self):
+        return str(self.user_id)
@@ -0,0 +1,114 @@
+"""Кэш целых страниц для анонимных читателей.
+
+Ответ view кэшируется целиком по адресу страницы, а его версия задаётся
+поколениями лент (см. posts.feed_cache), от которых страница зависит.
+Поколение — время последней публикации или правки в ленте, поэтому из
+него же получаются ETag и Last-Modified: повторный запрос с этими
+валидаторами получает 304, не доходя ни до view, ни до шаблонов.
+Обновление устаревшей страницы защищено от одновременного пересчёта
+(см. core.swr).
+"""
+from functools import wraps
+from hashlib import md5
+from math import ceil
+
+from django.conf import settings
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+from core import metrics, swr
+from . import feed_cache
+from .models import Group, Post, User
+
+
+def index_scopes(request):
+    return [feed_cache.INDEX]
+
+
+def group_scopes(request, slug):
+    group_id = Group.objects.filter(
+        slug=slug).values_list('id', flat=True).first()
+    if group_id is None:
+        return None
+    return [feed_cache.group(group_id)]
+
+
+def profile_scopes(request, username):
+    user_id = User.objects.filter(
+        username=username).values_list('id', flat=True).first()
+    if user_id is None:
+        return None
+    return [feed_cache.profile(user_id)]
+
+
+def post_scopes(request, post_id):
+    # На странице поста видны имя и число постов автора и название
+    # группы, поэтому она зависит от поколений профиля и группы, а не
+    # только от самого поста.
+    row = Post.objects.filter(id=post_id).values_list(
+        'author_id', 'group_id').first()
+    if row is None:
+        return None
+    author_id, group_id = row
+    scopes = [feed_cache.profile(author_id), feed_cache.comments(post_id)]
+    if group_id is not None:
+        scopes.append(feed_cache.group(group_id))
+    return scopes
+
+
+def anonymous_page_cache(scopes):
+    """Кэширует страницу для анонимов и отвечает 304 на повторные запросы.
+
+    `scopes(request, *args, **kwargs)` возвращает ленты, от которых
+    зависит страница, или None, если страницы нет: тогда view вызывается
+    как обычно и сам отвечает 404.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated):
+                return view(request, *args, **kwargs)
+            page_scopes = scopes(request, *args, **kwargs)
+            if page_scopes is None:
+                return view(request, *args, **kwargs)
+            generations = feed_cache.generations(*page_scopes)
+            last_modified = ceil(max(generations))
+            etag = quote_etag(md5(
+                f'{request.get_full_path()}:{generations!r}'.encode()
+            ).hexdigest())
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                metrics.incr('page_cache.not_modified')
+                return response
+
+            rendered = []
+
+            def render():
+                metrics.incr('page_cache.misses')
+                rendered.append(True)
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.cookies:
+                    response['ETag'] = etag
+                    response['Last-Modified'] = http_date(last_modified)
+                    patch_cache_control(response, max_age=0)
+                    patch_vary_headers(response, ('Cookie',))
+                return response
+
+            # Пока страницу перерисовывает один запрос, остальные получают
+            # прежнюю копию вместе с её собственными валидаторами.
+            response = swr.get_or_refresh(
+                f'page:{view.__module__}.{view.__name__}:'
+                f'{request.get_full_path()}',
+                render,
+                settings.PAGE_CACHE_TIMEOUT,
+                version=etag,
+                cacheable=lambda response: response.has_header('ETag'),
+            )
+            if not rendered:
+                metrics.incr('page_cache.hits')
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,353 @@
+import hashlib
+from collections.abc import Sequence
+from functools import partial
+from math import ceil
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import (
+    EmptyPage, InvalidPage, Page, PageNotAnInteger, Paginator)
+from django.db.models import QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from . import feed_cache
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def count_key(name):
+    return f'feed:count:{name}'
+
+
+def cached_count(name, queryset, timeout):
+    """COUNT(*) по queryset, закэшированный на `timeout` секунд."""
+    key = count_key(name)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+def admin_scope(model):
+    """Поколение (см. feed_cache) чисел строк списков админки `model`."""
+    return f'admin:{model._meta.label_lower}'
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator для списков админки по большим таблицам.
+
+    Число строк считается не дальше ADMIN_COUNT_LIMIT (COUNT(*) по
+    подзапросу с LIMIT) и кэшируется на ADMIN_COUNT_TIMEOUT секунд по
+    тексту запроса и поколению модели, поэтому листание списка и
+    повторные запросы с теми же фильтрами не пересчитывают таблицу, а
+    правки через админку видны сразу. Упёршись в предел, список пишет
+    «100000+». Страницы дальше предела недоступны: до таких записей
+    доходят фильтрами и поиском.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return 0
+        generation, = feed_cache.generations(admin_scope(queryset.model))
+        name = (f'admin:{generation}:'
+                + hashlib.md5(sql.encode()).hexdigest())
+        return cached_count(name, queryset[:settings.ADMIN_COUNT_LIMIT],
+                            settings.ADMIN_COUNT_TIMEOUT)
+
+    @property
+    def capped(self):
+        """Упёрлось ли число строк в ADMIN_COUNT_LIMIT."""
+        return self.count >= settings.ADMIN_COUNT_LIMIT
+
+
+class PageRows(Sequence):
+    """Строки страницы, которые выбираются из БД при первом обращении.
+
+    Пока к странице никто не обратился, запроса нет вовсе: если шаблон
+    отдал ленту из кэша фрагментов, база не трогается.
+    """
+
+    def __init__(self, object_list, per_page, transform=None):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.transform = transform
+        self._rows = None
+
+    def _fetch(self):
+        if self._rows is None:
+            rows = list(self.object_list)
+            self._has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            if self.transform is not None:
+                rows = [self.transform(row) for row in rows]
+            self._rows = rows
+        return self._rows
+
+    @property
+    def has_more(self):
+        self._fetch()
+        return self._has_more
+
+    def __getitem__(self, index):
+        return self._fetch()[index]
+
+    def __len__(self):
+        return len(self._fetch())
+
+
+class FeedPaginator(Paginator):
+    """Paginator, которому не нужен точный COUNT(*) на каждый запрос.
+
+    `count` — заранее известное (кэшированное или оценочное) число
+    объектов. Если его не передать, общее число не считается вовсе
+    (режим неизвестного итога). В обоих режимах страница выбирается
+    с одной лишней строкой: по ней видно, есть ли следующая страница,
+    поэтому неточная оценка не прячет посты и не даёт пустых ссылок.
+    Вместо полного `page_range` странице выдаётся `page_window()` —
+    первая, последняя (если итог известен) и `window` страниц вокруг
+    текущей, пропуски обозначены None.
+
+    Строки страницы выбираются лениво (см. PageRows); `transform`
+    применяется к каждой выбранной строке.
+    """
+
+    def __init__(self, object_list, per_page, count=None, window=2,
+                 transform=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.window = window
+        self.transform = transform
+        self.total_known = count is not None
+        if self.total_known:
+            self.count = count
+        self._rows = None
+
+    @property
+    def num_pages(self):
+        if self._rows is None:
+            return self.estimated_pages
+        if self._rows.has_more:
+            return max(self.estimated_pages, self._number + 1)
+        return self._number
+
+    @property
+    def estimated_pages(self):
+        if not self.total_known:
+            return 1
+        return max(1, ceil(self.count / self.per_page))
+
+    def validate_number(self, number):
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы не является числом')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def get_page(self, number):
+        try:
+            number = self.validate_number(number)
+        except InvalidPage:
+            number = 1
+        page = self.page(number)
+        if number > 1 and not page:
+            # Страница за концом ленты: как и Paginator, отдаём последнюю.
+            # Оценка могла быть завышена на много страниц, а без итога
+            # конца ленты не знаем вовсе, поэтому настоящее число строк
+            # до этой страницы считается заново.
+            count = self._count_before(number)
+            if self.total_known:
+                self.count = count
+            page = self.page(max(1, ceil(count / self.per_page)))
+        return page
+
+    def _count_before(self, number):
+        """Сколько строк на самом деле есть до страницы `number`.
+
+        Списки без длины (см. search.SearchResults) считают строки сами
+        через `count_up_to`, не выбирая их.
+        """
+        limit = (number - 1) * self.per_page
+        if hasattr(self.object_list, 'count_up_to'):
+            return self.object_list.count_up_to(limit)
+        rows = self.object_list[:limit]
+        if isinstance(rows, QuerySet):
+            return rows.count()
+        return len(rows)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        self._number = number
+        self._rows = PageRows(
+            self.object_list[bottom:bottom + self.per_page + 1],
+            self.per_page, self.transform)
+        return self._get_page(self._rows, number, self)
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        # Окно считается по вызову: шаблон вызывает его сам, и до этого
+        # строки страницы можно не выбирать.
+        page.page_window = partial(self.page_window, page.number)
+        return page
+
+    def page_window(self, number):
+        last = self.num_pages
+        pages = set(range(max(1, number - self.window),
+                          min(last, number + self.window) + 1))
+        pages.add(1)
+        if self.total_known:
+            pages.add(last)
+        window = []
+        for page in sorted(pages):
+            if window and page - window[-1] > 1:
+                window.append(None)
+            window.append(page)
+        return window
+
+
+class CursorPage(Page):
+    """Страница ленты, по которой ходят курсорами, а не номерами."""
+
+    cursor_mode = True
+
+    def __init__(self, object_list, paginator,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.last_cursor = paginator.last_cursor
+
+    def __repr__(self):
+        return '<CursorPage of %s objects>' % len(self)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по паре полей (дата, id).
+
+    Вместо LIMIT/OFFSET страница выбирается условием
+    `(date, id) < (курсор)`, поэтому тысячная страница стоит столько же,
+    сколько первая, а COUNT(*) не выполняется вовсе.
+    """
+
+    salt = 'posts.paginators.cursor'
+
+    def __init__(self, object_list, per_page,
+                 date_field='pub_date', id_field='id', transform=None):
+        self.date_field = date_field
+        self.id_field = id_field
+        self.transform = transform
+        super().__init__(
+            object_list.order_by(f'-{date_field}', f'-{id_field}'),
+            per_page
+        )
+
+    @property
+    def last_cursor(self):
+        return signing.dumps([PREVIOUS], salt=self.salt)
+
+    def encode_cursor(self, obj, direction):
+        return signing.dumps([
+            direction,
+            getattr(obj, self.date_field).isoformat(),
+            getattr(obj, self.id_field),
+        ], salt=self.salt)
+
+    def decode_cursor(self, cursor):
+        """Возвращает (направление, дата, id) или None для первой страницы."""
+        if not cursor:
+            return None
+        try:
+            direction, *key = signing.loads(cursor, salt=self.salt)
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+        if direction not in (NEXT, PREVIOUS):
+            return None
+        if not key:
+            return direction, None, None
+        try:
+            date, pk = parse_datetime(key[0]), int(key[1])
+        except (IndexError, TypeError, ValueError):
+            return None
+        if date is None:
+            return None
+        return direction, date, pk
+
+    def get_page(self, cursor):
+        decoded = self.decode_cursor(cursor)
+        if decoded is None:
+            return self._forward_page(self.object_list, first=True)
+        direction, date, pk = decoded
+        if direction == PREVIOUS:
+            return self._backward_page(date, pk)
+        return self._forward_page(self._after(date, pk))
+
+    def _after(self, date, pk):
+        # Условие записано через <= и exclude, чтобы SQLite мог начать
+        # обход индекса по дате сразу с нужного места.
+        return self.object_list.filter(
+            **{f'{self.date_field}__lte': date}
+        ).exclude(
+            **{self.date_field: date, f'{self.id_field}__gte': pk}
+        )
+
+    def _before(self, date, pk):
+        queryset = self.object_list.reverse()
+        if date is None:
+            return queryset
+        return queryset.filter(
+            **{f'{self.date_field}__gte': date}
+        ).exclude(
+            **{self.date_field: date, f'{self.id_field}__lte': pk}
+        )
+
+    def _rows(self, rows):
+        if self.transform is None:
+            return rows
+        return [self.transform(row) for row in rows]
+
+    def _forward_page(self, queryset, first=False):
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return CursorPage(
+            self._rows(rows),
+            self,
+            next_cursor=(
+                self.encode_cursor(rows[-1], NEXT) if has_next else None),
+            previous_cursor=(
+                self.encode_cursor(rows[0], PREVIOUS)
+                if rows and not first else None),
+        )
+
+    def _backward_page(self, date, pk):
+        rows = list(self._before(date, pk)[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(
+            self._rows(rows),
+            self,
+            next_cursor=(
+                self.encode_cursor(rows[-1], NEXT)
+                if rows and date is not None else None),
+            previous_cursor=(
+                self.encode_cursor(rows[0], PREVIOUS)
+                if has_previous else None),
+        )
@@ -0,0 +1,240 @@
+"""Маскировка запрещённых слов в комментариях.
+
+Словарь (BANNED_WORDS_FILE) компилируется в суффиксный бор: из корня
+можно пройти по любой подстроке любого слова, а узлы, где заканчивается
+слово целиком, помечены. Текст проходится один раз слева направо,
+буфер растёт, пока остаётся подстрокой какого-нибудь слова. Буфер,
+совпавший со словом, заменяется звёздочками, а буфер, который перестал
+быть подстрокой, выводится как есть. Бор пересобирается, только когда
+у файла меняется mtime.
+
+Затем работает нечёткий проход: каждое слово текста приводится к
+нижнему регистру, латинские и цифровые двойники заменяются кириллицей,
+а его начала ищутся в индексе удалений словаря. Так ловятся «дурaк»
+с латинской «a» и опечатки в одну букву. Опечатки допускаются только
+в словах словаря длиннее BANNED_WORDS_EXACT_MAX_LENGTH букв (не больше
+BANNED_WORDS_MAX_DISTANCE): короткую основу одна замена превращает в
+обычное слово («донцов» — «концов»). Начало слова, которое короче
+самого слова, засчитывается, только если его первая буква совпадает
+с первой буквой слова словаря. Нечётко проверяются только первые
+BANNED_WORDS_FUZZY_MAX_WORDS слов текста, остальные — только точно, а
+счётчик profanity.fuzzy.limit_exceeded растёт.
+"""
+import os
+import re
+import threading
+
+from django.conf import settings
+
+from core import metrics
+
+PATTERN = '*'
+# Ключ-метка конца слова: символы текста не бывают пустой строкой.
+END = ''
+WORD = re.compile(r'[\w@]+')
+# Латинские буквы и цифры, похожие на кириллические. Замена один к
+# одному, чтобы позиции в нормализованном слове совпадали с исходным.
+HOMOGLYPHS = str.maketrans(
+    'aeopcxykmthbu' '0346@' 'ё',
+    'аеорсхукмтнви' 'озчба' 'е',
+)
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def normalize(text):
+    return text.lower().translate(HOMOGLYPHS)
+
+
+def distance(first, second, limit):
+    """Расстояние Левенштейна или limit + 1, если оно больше limit."""
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+        for j, second_char in enumerate(second, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (first_char != second_char),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def deletions(word, limit):
+    """Все строки, которые получаются из word удалением до limit букв."""
+    found = frontier = {word}
+    for _ in range(limit):
+        frontier = {
+            variant[:i] + variant[i + 1:]
+            for variant in frontier for i in range(len(variant))
+        }
+        found = found | frontier
+    return found
+
+
+class FuzzyIndex:
+    """Индекс удалений словаря для поиска на расстоянии до limit.
+
+    Если два слова на расстоянии не больше limit, у них есть общая
+    строка, полученная удалением не больше limit букв из каждого.
+    Поэтому кандидаты находятся несколькими поисками в словаре,
+    а точное расстояние считается только для них. Слова словаря не
+    длиннее exact_length ищутся без опечаток.
+    """
+
+    def __init__(self, words, limit, exact_length=0):
+        self.limit = limit
+        self.exact_length = exact_length
+        self.variants = {}
+        self.lengths = set()
+        for word in words:
+            allowed = self.allowed(word)
+            for variant in deletions(word, allowed):
+                self.variants.setdefault(variant, set()).add(word)
+            self.lengths.update(
+                range(len(word) - allowed, len(word) + allowed + 1))
+
+    def allowed(self, word):
+        """Допустимое расстояние до слова словаря `word`."""
+        return self.limit if len(word) > self.exact_length else 0
+
+    def closest(self, word):
+        """{длина начала слова: наименьшее допустимое расстояние}.
+
+        Начало короче слова должно начинаться с той же буквы, что и
+        найденное слово словаря.
+        """
+        found = {}
+        for length in self.lengths:
+            if not 0 < length <= len(word):
+                continue
+            prefix = word[:length]
+            candidates = set()
+            for variant in deletions(prefix, self.limit):
+                candidates |= self.variants.get(variant, set())
+            best = None
+            for candidate in candidates:
+                if length < len(word) and candidate[0] != prefix[0]:
+                    continue
+                allowed = self.allowed(candidate)
+                dist = distance(prefix, candidate, allowed)
+                if dist <= allowed and (best is None or dist < best):
+                    best = dist
+            if best is not None:
+                found[length] = best
+        return found
+
+
+class Matcher:
+    def __init__(self, words):
+        self.normalized = [normalize(word) for word in words]
+        self.fuzzy = {}
+        self.root = {}
+        for word in words:
+            for start in range(len(word)):
+                node = self.root
+                for char in word[start:]:
+                    node = node.setdefault(char, {})
+                if start == 0:
+                    node[END] = True
+
+    def _step(self, node, char):
+        for lowered in char.lower():
+            node = node.get(lowered)
+            if node is None:
+                return None
+        return node
+
+    def mask(self, text, pattern=PATTERN):
+        result = []
+        start = 0
+        node = self.root
+        for position, char in enumerate(text):
+            node = self._step(node, char)
+            if node is None:
+                result.append(text[start:position + 1])
+            elif END in node:
+                result.append(pattern * (position + 1 - start))
+            else:
+                continue
+            start = position + 1
+            node = self.root
+        result.append(text[start:])
+        return ''.join(result)
+
+    def mask_fuzzy(self, text, limit, max_words, min_length,
+                   exact_length, pattern=PATTERN, record=True):
+        """Маскирует начала слов, похожие на слова словаря.
+
+        Проверяются только первые max_words слов. С record=False
+        счётчики не пишутся: так маскировку можно запускать в
+        процессах, которым кэш недоступен.
+        """
+        if limit <= 0 or not self.normalized:
+            return text
+        key = (limit, exact_length)
+        if key not in self.fuzzy:
+            self.fuzzy[key] = FuzzyIndex(self.normalized, limit, exact_length)
+        index = self.fuzzy[key]
+        result = list(text)
+        checked = 0
+        for match in WORD.finditer(text):
+            word = match.group()
+            if pattern in word or len(word) < min_length:
+                continue
+            if checked >= max_words:
+                if record:
+                    metrics.incr('profanity.fuzzy.limit_exceeded')
+                break
+            checked += 1
+            # Из похожих начал слова берём самое близкое к словарю,
+            # при равенстве — самое длинное.
+            found = [
+                (dist, -length) for length, dist in
+                index.closest(normalize(word)).items()
+                if length >= min_length
+            ]
+            if found:
+                length = -min(found)[1]
+                start = match.start()
+                result[start:start + length] = pattern * length
+                if record:
+                    metrics.incr('profanity.fuzzy.matches')
+        return ''.join(result)
+
+
+def read_words(path=None):
+    with open(path or settings.BANNED_WORDS_FILE, encoding='utf-8') as words:
+        return words.read().split()
+
+
+def get_matcher(path=None):
+    """Matcher для файла `path`; пересобирается при смене mtime."""
+    path = path or settings.BANNED_WORDS_FILE
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _lock:
+        cached = _cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, Matcher(read_words(path)))
+            _cache[path] = cached
+    return cached[1]
+
+
+def mask(text):
+    matcher = get_matcher()
+    return matcher.mask_fuzzy(
+        matcher.mask(text),
+        settings.BANNED_WORDS_MAX_DISTANCE,
+        settings.BANNED_WORDS_FUZZY_MAX_WORDS,
+        settings.BANNED_WORDS_FUZZY_MIN_LENGTH,
+        settings.BANNED_WORDS_EXACT_MAX_LENGTH,
+    )
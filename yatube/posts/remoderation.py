@@ -0,0 +1,153 @@
+"""Повторная проверка сохранённых комментариев по текущему словарю.
+
+Комментарии читаются пачками по возрастанию id (keyset, без OFFSET) и
+маскируются в пуле процессов. По умолчанию применяется только точный
+словарь, нечёткий проход включается явно (fuzzy=True): он может
+задеть обычные слова, а исходный текст после записи не восстановить.
+Строка записывается, только если её текст не изменился с момента
+чтения, поэтому правка автора в это время не теряется. После каждой
+записанной пачки её последний id сохраняется в файл контрольной
+точки, поэтому прерванный прогон продолжается с того же места. Прогон
+с dry_run=True ничего не пишет и проверяет все комментарии.
+"""
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import feed_cache, profanity
+from .models import Comment
+
+_worker = None
+
+
+def _init_worker(words, limit, min_length, exact_length):
+    global _worker
+    _worker = (profanity.Matcher(words), limit, min_length, exact_length)
+
+
+def _moderate(rows):
+    """Изменённые строки пачки (id, post_id, старый текст, новый)."""
+    matcher, limit, min_length, exact_length = _worker
+    changed = []
+    for pk, post_id, text in rows:
+        # Пакетная проверка не ограничена по числу слов и не пишет
+        # счётчики: у процессов пула нет своего соединения с кэшем.
+        masked = matcher.mask_fuzzy(
+            matcher.mask(text), limit, math.inf, min_length, exact_length,
+            record=False)
+        if masked != text:
+            changed.append((pk, post_id, text, masked))
+    return changed
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, last_id):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as checkpoint:
+        checkpoint.write(str(last_id))
+    os.replace(temporary, path)
+
+
+def chunks(last_id, size):
+    """Пачки (id, post_id, text) с id больше last_id."""
+    while True:
+        rows = list(
+            Comment.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'post_id', 'text')[:size]
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def save(changed):
+    """Записывает новые тексты; возвращает число записанных строк.
+
+    Строка, текст которой уже не совпадает с прочитанным, пропускается.
+    """
+    saved = 0
+    posts = set()
+    with transaction.atomic():
+        for pk, post_id, old, new in changed:
+            if Comment.objects.filter(pk=pk, text=old).update(text=new):
+                saved += 1
+                posts.add(post_id)
+        # update() не шлёт сигналов: сдвигаем поколения сами.
+        if posts:
+            transaction.on_commit(partial(
+                feed_cache.bump,
+                *{feed_cache.comments(post_id) for post_id in posts}))
+    return saved
+
+
+def _apply(result, dry_run, report):
+    """Сообщает о заменах пачки и записывает их, если это не dry_run."""
+    if report is not None:
+        for pk, _, old, new in result:
+            report(pk, old, new)
+    if dry_run or not result:
+        return len(result)
+    return save(result)
+
+
+def remoderate(checkpoint, chunk_size, workers, progress=None,
+               fuzzy=False, dry_run=False, report=None):
+    """Проверяет комментарии после контрольной точки.
+
+    Возвращает (проверено, изменено). `progress(last_id, checked,
+    changed)` вызывается после каждой обработанной пачки, `report(id,
+    старый текст, новый)` — для каждой найденной замены. С dry_run
+    ничего не записывается, а проверка идёт с первого комментария.
+    """
+    limit = settings.BANNED_WORDS_MAX_DISTANCE if fuzzy else 0
+    args = (profanity.read_words(), limit,
+            settings.BANNED_WORDS_FUZZY_MIN_LENGTH,
+            settings.BANNED_WORDS_EXACT_MAX_LENGTH)
+    checked = changed = 0
+
+    def commit(rows, result):
+        nonlocal checked, changed
+        changed += _apply(result, dry_run, report)
+        if not dry_run:
+            write_checkpoint(checkpoint, rows[-1][0])
+        checked += len(rows)
+        if progress is not None:
+            progress(rows[-1][0], checked, changed)
+
+    start = 0 if dry_run else read_checkpoint(checkpoint)
+    source = chunks(start, chunk_size)
+    if workers <= 1:
+        _init_worker(*args)
+        for rows in source:
+            commit(rows, _moderate(rows))
+        return checked, changed
+    # Соединения с БД нельзя делить с дочерними процессами.
+    connections.close_all()
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=args) as pool:
+        # Пачки читаются не дальше чем на 2 * workers вперёд, а
+        # записываются строго по порядку, чтобы контрольная точка
+        # не обгоняла записанные данные.
+        pending = deque()
+        for rows in source:
+            pending.append((rows, pool.submit(_moderate, rows)))
+            if len(pending) >= 2 * workers:
+                rows, future = pending.popleft()
+                commit(rows, future.result())
+        while pending:
+            rows, future = pending.popleft()
+            commit(rows, future.result())
+    return checked, changed
@@ -0,0 +1,179 @@
+"""Полнотекстовый поиск по постам и комментариям (SQLite FTS5).
+
+Индексы posts_post_fts и posts_comment_fts хранят только словари слов,
+сам текст они читают из posts_post и posts_comment (external content).
+Триггеры на этих таблицах обновляют индексы в той же транзакции, что и
+запись, поэтому индекс не отстаёт от базы. SQLite пересоздаёт таблицу
+при некоторых миграциях и теряет её триггеры: `ensure_index` после
+каждого migrate восстанавливает их и перестраивает индекс.
+
+Слова запроса длиной от SEARCH_PREFIX_MIN_LENGTH букв ищутся как
+префиксы ("котик" найдёт «котики»), короткие — целиком: префикс из
+пары букв раскрывается в тысячи слов. Все слова должны встретиться в
+тексте поста или в одном комментарии. Посты ранжируются по bm25;
+совпадение в комментарии весит SEARCH_COMMENT_WEIGHT от совпадения в
+тексте поста. Ранжируются только SEARCH_MAX_RESULTS самых новых
+совпадений каждого индекса: FTS5 читает их с конца списка документов
+и дальше не идёт, поэтому частое слово не заставляет считать bm25 по
+всему индексу. Общее число найденных не считается вовсе (см.
+FeedPaginator).
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+WORD = re.compile(r'\w+')
+
+TRIGGERS = {
+    'posts_post_fts_insert': '''
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert
+        AFTER INSERT ON posts_post BEGIN
+            INSERT INTO posts_post_fts (rowid, text)
+            VALUES (new.id, new.text);
+        END''',
+    'posts_post_fts_delete': '''
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete
+        AFTER DELETE ON posts_post BEGIN
+            INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END''',
+    'posts_post_fts_update': '''
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_update
+        AFTER UPDATE OF text ON posts_post BEGIN
+            INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO posts_post_fts (rowid, text)
+            VALUES (new.id, new.text);
+        END''',
+    'posts_comment_fts_insert': '''
+        CREATE TRIGGER IF NOT EXISTS posts_comment_fts_insert
+        AFTER INSERT ON posts_comment BEGIN
+            INSERT INTO posts_comment_fts (rowid, text, post_id)
+            VALUES (new.id, new.text, new.post_id);
+        END''',
+    'posts_comment_fts_delete': '''
+        CREATE TRIGGER IF NOT EXISTS posts_comment_fts_delete
+        AFTER DELETE ON posts_comment BEGIN
+            INSERT INTO posts_comment_fts
+                (posts_comment_fts, rowid, text, post_id)
+            VALUES ('delete', old.id, old.text, old.post_id);
+        END''',
+    'posts_comment_fts_update': '''
+        CREATE TRIGGER IF NOT EXISTS posts_comment_fts_update
+        AFTER UPDATE OF text, post_id ON posts_comment BEGIN
+            INSERT INTO posts_comment_fts
+                (posts_comment_fts, rowid, text, post_id)
+            VALUES ('delete', old.id, old.text, old.post_id);
+            INSERT INTO posts_comment_fts (rowid, text, post_id)
+            VALUES (new.id, new.text, new.post_id);
+        END''',
+}
+
+REBUILD = (
+    "INSERT INTO posts_post_fts (posts_post_fts) VALUES ('rebuild')",
+    "INSERT INTO posts_comment_fts (posts_comment_fts) VALUES ('rebuild')",
+)
+
+RANKED_SQL = '''
+    SELECT post_id FROM (
+        SELECT * FROM (
+            SELECT rowid AS post_id, rank AS score FROM posts_post_fts
+            WHERE posts_post_fts MATCH %s ORDER BY rowid DESC LIMIT %s
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT post_id, rank * %s AS score FROM posts_comment_fts
+            WHERE posts_comment_fts MATCH %s
+            ORDER BY rowid DESC LIMIT %s
+        )
+    )
+    GROUP BY post_id
+    ORDER BY MIN(score), post_id DESC
+    LIMIT %s OFFSET %s
+'''
+
+
+def match_expression(query):
+    """Запрос в синтаксисе FTS5 MATCH или '', если в нём нет слов.
+
+    Каждое слово берётся в кавычки, поэтому операторы и скобки из
+    пользовательского ввода не ломают запрос.
+    """
+    words = WORD.findall(query.lower())[:settings.SEARCH_MAX_WORDS]
+    return ' '.join(
+        f'"{word}"*' if len(word) >= settings.SEARCH_PREFIX_MIN_LENGTH
+        else f'"{word}"'
+        for word in words)
+
+
+def matching(table, query):
+    """RawSQL с rowid строк индекса `table`, подходящих под `query`."""
+    return RawSQL(
+        f'SELECT rowid FROM {table} WHERE {table} MATCH %s',
+        (match_expression(query),))
+
+
+class SearchResults:
+    """Найденные посты по убыванию релевантности.
+
+    Срез выполняет один запрос к индексам и один за самими постами;
+    длины нет, поэтому её не спрашивает и FeedPaginator без `count`.
+    """
+
+    def __init__(self, query, rows=False):
+        self.expression = match_expression(query)
+        self.rows = rows
+
+    def post_ids(self, offset, limit):
+        if not self.expression:
+            return []
+        cap = settings.SEARCH_MAX_RESULTS
+        limit = max(0, min(limit, cap - offset))
+        with connection.cursor() as cursor:
+            cursor.execute(RANKED_SQL, (
+                self.expression, cap,
+                settings.SEARCH_COMMENT_WEIGHT, self.expression, cap,
+                limit, offset,
+            ))
+            return [post_id for post_id, in cursor.fetchall()]
+
+    def count_up_to(self, limit):
+        """Сколько из первых `limit` результатов есть на самом деле."""
+        return len(self.post_ids(0, limit))
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError('SearchResults поддерживает только срезы')
+        offset = index.start or 0
+        ids = self.post_ids(offset, index.stop - offset)
+        if not ids:
+            return []
+        posts = {
+            post.id: post for post in
+            Post.objects.feed(rows=self.rows).filter(id__in=ids)
+        }
+        return [posts[post_id] for post_id in ids if post_id in posts]
+
+
+def ensure_index(using=connection):
+    """Восстанавливает потерянные триггеры и перестраивает индекс.
+
+    Возвращает True, если индекс пришлось перестроить.
+    """
+    if using.vendor != 'sqlite':
+        return False
+    with using.cursor() as cursor:
+        cursor.execute("SELECT type, name FROM sqlite_master")
+        existing = {name for _, name in cursor.fetchall()}
+        if ('posts_post_fts' not in existing
+                or existing >= set(TRIGGERS)):
+            return False
+        for sql in TRIGGERS.values():
+            cursor.execute(sql)
+        for sql in REBUILD:
+            cursor.execute(sql)
+    return True
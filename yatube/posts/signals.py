@@ -0,0 +1,212 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import counters, feed_cache, search, thumbnails, timeline
+from .choices import GROUP_CHOICES_KEY
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+from .paginators import count_key
+
+
+def after_commit(func, *args, **kwargs):
+    """Вызывает func(*args, **kwargs) после коммита текущей транзакции.
+
+    Поколения лент и кэши сбрасываются только после коммита: иначе
+    читатель успеет увидеть новое поколение, отрисовать ещё старые
+    данные и закэшировать их под новым ключом на весь таймаут.
+    """
+    transaction.on_commit(partial(func, *args, **kwargs))
+
+
+def displayed_name(user):
+    # Через __dict__, чтобы не загружать отложенные поля.
+    return tuple(user.__dict__.get(field)
+                 for field in ('username', 'first_name', 'last_name'))
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    instance._saved_name = displayed_name(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        AuthorStats.objects.get_or_create(user=instance)
+    elif displayed_name(instance) != instance._saved_name:
+        # Имя автора видно в карточках его постов, а имя пользователя —
+        # и под его комментариями.
+        post_ids = Comment.objects.filter(author=instance).values_list(
+            'post_id', flat=True).distinct()
+        after_commit(
+            feed_cache.bump,
+            *feed_cache.author_scopes([instance.pk]),
+            *(feed_cache.comments(post_id) for post_id in post_ids))
+    instance._saved_name = displayed_name(instance)
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    # Запоминаем группу и автора, чтобы при их смене поправить оба
+    # счётчика. Через __dict__, чтобы не загружать отложенные поля.
+    instance._saved_group_id = instance.__dict__.get('group_id')
+    instance._saved_author_id = instance.__dict__.get('author_id')
+    instance._saved_image = thumbnails.source_name(
+        instance.__dict__.get('image'))
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    # Новый файл FileField сохранит в хранилище (и добавит ссылку)
+    # уже после этого сигнала.
+    instance._new_image = (
+        bool(instance.image) and not instance.image._committed)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.bump_author(instance.author_id, posts_count=1)
+        counters.bump_group(instance.group_id, 1)
+        after_commit(cache.delete, count_key('index'))
+        timeline.fan_out_post(instance)
+    else:
+        if instance._saved_group_id != instance.group_id:
+            counters.bump_group(instance._saved_group_id, -1)
+            counters.bump_group(instance.group_id, 1)
+        if instance._saved_author_id != instance.author_id:
+            counters.bump_author(instance._saved_author_id, posts_count=-1)
+            counters.bump_author(instance.author_id, posts_count=1)
+            timeline.reassign_post(instance)
+    after_commit(feed_cache.post_changed,
+                 instance, instance._saved_group_id, instance.group_id,
+                 author_ids=[instance._saved_author_id])
+    instance._saved_group_id = instance.group_id
+    instance._saved_author_id = instance.author_id
+    image = thumbnails.source_name(instance.image)
+    if image != instance._saved_image:
+        if image:
+            # Когда миниатюры готовы, ленты перерисовываются уже с ними.
+            thumbnails.schedule(image, partial(
+                feed_cache.post_changed, instance, instance.group_id))
+        release_image(instance._saved_image)
+    elif instance._new_image:
+        # Загрузили ту же картинку ещё раз: ссылка на неё у поста уже есть.
+        release_image(image)
+    instance._saved_image = image
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_author(instance.author_id, posts_count=-1)
+    counters.bump_group(instance.group_id, -1)
+    after_commit(cache.delete, count_key('index'))
+    after_commit(feed_cache.post_changed, instance, instance.group_id)
+    release_image(thumbnails.source_name(instance.image))
+
+
+def release_image(name):
+    """Снимает ссылку на картинку после коммита; последняя — с миниатюрами."""
+    if not name:
+        return
+    storage = Post._meta.get_field('image').storage
+
+    def release():
+        if storage.release(name):
+            thumbnails.forget(name)
+
+    transaction.on_commit(release)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.bump_post_comments(instance.post_id, 1)
+    after_commit(feed_cache.bump, feed_cache.comments(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_post_comments(instance.post_id, -1)
+    after_commit(feed_cache.bump, feed_cache.comments(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_author(instance.author_id, followers_count=1)
+        counters.bump_author(instance.user_id, following_count=1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        follow_changed(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_author(instance.author_id, followers_count=-1)
+    counters.bump_author(instance.user_id, following_count=-1)
+    timeline.purge(instance.user_id, instance.author_id)
+    follow_changed(instance)
+    if instance.author_id in timeline.pull_authors() and (
+            AuthorStats.objects.filter(
+                user_id=instance.author_id,
+                followers_count__lt=settings.TIMELINE_FANOUT_LIMIT).exists()):
+        after_commit(author_pushed, instance.author_id)
+
+
+def author_pushed(author_id):
+    # Автор опустился ниже порога: дописываем подписчикам его посты,
+    # которые они ещё не подтянули.
+    readers = timeline.stop_pulling(author_id)
+    feed_cache.bump(*(feed_cache.follow(user_id) for user_id in readers))
+
+
+def follow_changed(follow):
+    # Счётчики подписок видны в шапках обоих профилей.
+    after_commit(
+        feed_cache.bump,
+        feed_cache.follow(follow.user_id),
+        feed_cache.profile(follow.user_id),
+        feed_cache.profile(follow.author_id),
+    )
+
+
+def group_authors(group_id):
+    return list(Post.objects.filter(group_id=group_id).order_by().values_list(
+        'author_id', flat=True).distinct())
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, raw=False, **kwargs):
+    after_commit(cache.delete, GROUP_CHOICES_KEY)
+    if not created and not raw:
+        after_commit(feed_cache.group_changed,
+                     instance.pk, group_authors(instance.pk))
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # После удаления у постов уже не будет группы, по которой их найти.
+    instance._authors = group_authors(instance.pk)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    after_commit(cache.delete, GROUP_CHOICES_KEY)
+    after_commit(feed_cache.group_changed,
+                 instance.pk, getattr(instance, '_authors', []))
+
+
+def migrated(sender, using, **kwargs):
+    # SQLite теряет триггеры поиска, когда миграция пересоздаёт таблицу.
+    search.ensure_index(connections[using])
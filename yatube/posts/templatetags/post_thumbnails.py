@@ -0,0 +1,53 @@
+from functools import partial
+
+from django import template
+from sorl.thumbnail import default
+
+from core import metrics
+from posts import feed_cache, thumbnails
+
+register = template.Library()
+
+
+def _page_thumbnails(context, size):
+    """Миниатюры всех постов `page_obj`, найденные одним обращением.
+
+    Результат запоминается на самой странице: карточки рисуются
+    отдельными {% include %}, у которых общий только контекст.
+    """
+    page = context.get('page_obj')
+    if page is None:
+        return {}
+    resolved = page.__dict__.setdefault('_post_thumbnails', {})
+    if size not in resolved:
+        names = [thumbnails.source_name(post.image) for post in page]
+        resolved[size] = thumbnails.lookup_many(filter(None, names), size)
+    return resolved[size]
+
+
+@register.simple_tag(takes_context=True)
+def post_thumbnail(context, post, size):
+    """Миниатюра картинки поста, не дожидаясь её подготовки.
+
+    {% post_thumbnail post "card" as im %}
+
+    Возвращает thumbnails.Thumbnail: адрес и размеры основной миниатюры
+    и srcset её вариантов. Если готовы не все варианты, картинка
+    ставится в очередь; пока нет основной миниатюры, вместо неё
+    возвращается исходный файл без размеров. У поста без картинки — None.
+    """
+    name = thumbnails.source_name(post.image)
+    if name is None:
+        return None
+    page = _page_thumbnails(context, size)
+    thumbnail = (page[name] if name in page
+                 else thumbnails.lookup(name, size))
+    if thumbnail is not None and thumbnail.complete:
+        return thumbnail
+    metrics.incr('thumbnails.misses')
+    thumbnails.queue(
+        name, partial(feed_cache.post_changed, post, post.group_id))
+    if thumbnail is not None:
+        return thumbnail
+    return thumbnails.Thumbnail(
+        default.storage.url(name), None, None, '', '', '', False)
@@ -1,16 +1,26 @@
+import hashlib
 import shutil
 import tempfile
+from io import BytesIO
+from unittest import mock
 
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
 from posts.models import Post, Group, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+def stored_name(content, extension):
+    """Имя, под которым хранилище сохраняет картинку с таким содержимым."""
+    digest = hashlib.sha256(content).hexdigest()
+    return f'posts/{digest[:2]}/{digest[2:]}{extension}'
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostCreateFormTests(TestCase):
     @classmethod
@@ -79,7 +89,7 @@ class PostCreateFormTests(TestCase):
                 text='Тестовый текст',
                 author=PostCreateFormTests.user,
                 group=None,
-                image='posts/small.gif'
+                image=stored_name(small_gif, '.gif')
             ).exists(),
         )
 
@@ -237,7 +247,7 @@ class PostCreateFormTests(TestCase):
                 text='Тестовый текст2',
                 author=PostCreateFormTests.user,
                 group=None,
-                image='posts/small3.gif'
+                image=stored_name(small_gif, '.gif')
             ).exists(),
         )
         self.assertEqual(Post.objects.count(), posts_count)
@@ -263,3 +273,97 @@ class PostCreateFormTests(TestCase):
             ).exists()
         )
         self.assertEqual(Post.objects.count(), posts_count)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageIngestTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(ImageIngestTests.user)
+
+    def upload(self, name, size, image_format, **params):
+        buffer = BytesIO()
+        Image.effect_noise(size, 64).convert('RGB').save(
+            buffer, image_format, **params)
+        return self.client.post(reverse('posts:post_create'), data={
+            'text': name,
+            'image': SimpleUploadedFile(name, buffer.getvalue()),
+        })
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=1024)
+    def test_oversized_upload_rejected(self):
+        """Файл больше POST_IMAGE_MAX_UPLOAD_SIZE не принимается."""
+        response = self.upload('big.png', (200, 200), 'PNG')
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 1,0\xa0КБ.')
+        self.assertFalse(Post.objects.filter(text='big.png').exists())
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=1024)
+    def test_oversized_upload_aborted(self):
+        """Загрузка обрывается на пределе и не доходит до формы."""
+        with mock.patch('posts.forms.uploads.check_size') as check_size:
+            response = self.upload('big.png', (200, 200), 'PNG')
+        check_size.assert_not_called()
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 1,0\xa0КБ.')
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=1024)
+    def test_oversized_upload_on_edit(self):
+        """При правке поста слишком большой файл тоже отклоняется."""
+        post = Post.objects.create(
+            author=ImageIngestTests.user, text='Пост')
+        buffer = BytesIO()
+        Image.effect_noise((200, 200), 64).convert('RGB').save(
+            buffer, 'PNG')
+        response = self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Новый текст',
+                  'image': SimpleUploadedFile('big.png', buffer.getvalue())})
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 1,0\xa0КБ.')
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Пост')
+
+    def test_csrf_still_checked(self):
+        """Views с загрузкой по-прежнему требуют CSRF-токен."""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(ImageIngestTests.user)
+        response = client.post(
+            reverse('posts:post_create'), data={'text': 'Без токена'})
+        self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertFalse(Post.objects.filter(text='Без токена').exists())
+
+    def test_handler_not_global(self):
+        """Ограничение загрузки подключается только во views постов."""
+        self.assertNotIn(
+            'posts.uploads.BoundedUploadHandler',
+            settings.FILE_UPLOAD_HANDLERS)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels_rejected(self):
+        """Картинка с огромным числом пикселей отклоняется по заголовку."""
+        with mock.patch('posts.forms.uploads.ingest') as ingest:
+            response = self.upload('bomb.png', (20, 20), 'PNG')
+        ingest.assert_not_called()
+        self.assertFormError(
+            response, 'form', 'image', 'Картинка больше 0.0001 мегапикселей.')
+
+    @override_settings(POST_IMAGE_MAX_SIDE=300)
+    def test_jpeg_downscaled_without_metadata(self):
+        """Исходник уменьшается до POST_IMAGE_MAX_SIDE и теряет EXIF."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        self.upload('photo.jpg', (1200, 600), 'JPEG', exif=exif.tobytes())
+        post = Post.objects.get(text='photo.jpg')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (300, 150))
+            self.assertNotIn('exif', image.info)
@@ -0,0 +1,71 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Переводит базу на `migrate_from`, чтобы заполнить её, и обратно."""
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes()
+        executor.migrate([self.migrate_from])
+        self.old_apps = executor.loader.project_state(
+            [self.migrate_from]).apps
+        self.addCleanup(self.migrate, self.latest)
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+
+class CountersBackfillTests(MigrationTestCase):
+    migrate_from = ('posts', '0017_timeline_pull_index')
+
+    def test_counters_filled(self):
+        User = self.old_apps.get_model('auth', 'User')
+        Group = self.old_apps.get_model('posts', 'Group')
+        Post = self.old_apps.get_model('posts', 'Post')
+        Follow = self.old_apps.get_model('posts', 'Follow')
+        author = User.objects.create(username='author')
+        reader = User.objects.create(username='reader')
+        group = Group.objects.create(title='Группа', slug='group')
+        for i in range(5):
+            Post.objects.create(author=author, group=group, text=f'Пост {i}')
+        Post.objects.create(author=author, text='Без группы')
+        Follow.objects.create(user=reader, author=author)
+
+        apps = self.migrate([('posts', '0018_counters')])
+        AuthorStats = apps.get_model('posts', 'AuthorStats')
+        stats = AuthorStats.objects.get(user_id=author.pk)
+        self.assertEqual(stats.posts_count, 6)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(
+            AuthorStats.objects.get(user_id=reader.pk).following_count, 1)
+        self.assertEqual(
+            apps.get_model('posts', 'Group').objects.get(
+                pk=group.pk).posts_count, 5)
+
+
+class CommentsCountBackfillTests(MigrationTestCase):
+    migrate_from = ('posts', '0018_counters')
+
+    def test_comments_count_filled(self):
+        User = self.old_apps.get_model('auth', 'User')
+        Post = self.old_apps.get_model('posts', 'Post')
+        Comment = self.old_apps.get_model('posts', 'Comment')
+        author = User.objects.create(username='author')
+        post = Post.objects.create(author=author, text='Пост')
+        quiet = Post.objects.create(author=author, text='Без комментариев')
+        for i in range(4):
+            Comment.objects.create(
+                post=post, author=author, text=f'Комментарий {i}')
+
+        apps = self.migrate([('posts', '0019_comments_count')])
+        Post = apps.get_model('posts', 'Post')
+        self.assertEqual(Post.objects.get(pk=post.pk).comments_count, 4)
+        self.assertEqual(Post.objects.get(pk=quiet.pk).comments_count, 0)
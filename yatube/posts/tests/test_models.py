@@ -1,8 +1,15 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.conf import settings
 
-from ..models import Group, Post, Comment
+from ..models import AuthorStats, Group, Post, Comment, Follow
+from ..remoderation import save
 
 User = get_user_model()
 
@@ -109,3 +116,150 @@ class CommentModelTest(TestCase):
                 self.assertEqual(
                     comment._meta.get_field(field).help_text,
                     expected_value)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='one',
+            description='Тестовое описание',
+        )
+        cls.group2 = Group.objects.create(
+            title='Тестовая группа2',
+            slug='two',
+            description='Тестовое описание',
+        )
+
+    def assertCounters(self, user, posts, followers, following):
+        stats = AuthorStats.objects.get(user=user)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count,
+             stats.following_count),
+            (posts, followers, following)
+        )
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются вместе с постами и подписками."""
+        post = Post.objects.create(
+            author=self.author, text='Тестовый пост', group=self.group)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertCounters(self.author, 1, 1, 0)
+        self.assertCounters(self.reader, 0, 0, 1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        post = Post.objects.get(pk=post.pk)
+        post.group = self.group2
+        post.save()
+        self.group.refresh_from_db()
+        self.group2.refresh_from_db()
+        self.assertEqual(
+            (self.group.posts_count, self.group2.posts_count), (0, 1))
+        post.delete()
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertCounters(self.author, 0, 0, 0)
+        self.assertCounters(self.reader, 0, 0, 0)
+        self.group2.refresh_from_db()
+        self.assertEqual(self.group2.posts_count, 0)
+
+    def test_author_change_moves_counter(self):
+        """Передача поста другому автору правит счётчики обоих."""
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        post = Post.objects.get(pk=post.pk)
+        post.author = self.reader
+        post.save()
+        self.assertCounters(self.author, 0, 0, 0)
+        self.assertCounters(self.reader, 1, 0, 0)
+
+    def test_recount_repairs_counters(self):
+        """Команда recount_counters восстанавливает счётчики."""
+        Post.objects.create(
+            author=self.author, text='Тестовый пост', group=self.group)
+        Follow.objects.create(user=self.reader, author=self.author)
+        AuthorStats.objects.update(
+            posts_count=7, followers_count=7, following_count=7)
+        AuthorStats.objects.filter(user=self.reader).delete()
+        Group.objects.update(posts_count=7)
+        call_command('recount_counters', stdout=StringIO())
+        self.assertCounters(self.author, 1, 1, 0)
+        self.assertCounters(self.reader, 0, 0, 1)
+        self.group.refresh_from_db()
+        self.group2.refresh_from_db()
+        self.assertEqual(
+            (self.group.posts_count, self.group2.posts_count), (1, 0))
+
+
+class RemoderateCommentsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.checkpoint = os.path.join(directory, 'checkpoint')
+        words = os.path.join(directory, 'words.txt')
+        with open(words, 'w', encoding='utf-8') as file:
+            file.write('шалыгин')
+        override = override_settings(BANNED_WORDS_FILE=words)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.comments = [
+            Comment.objects.create(
+                post=self.post, author=self.user, text=text)
+            for text in ('Привет', 'Сам шалыгин', 'Шалыгим!')
+        ]
+
+    def remoderate(self, **options):
+        out = StringIO()
+        call_command('remoderate_comments', checkpoint=self.checkpoint,
+                     workers=1, chunk_size=2, stdout=out, **options)
+        self.out = out.getvalue()
+        return [comment.text for comment in
+                Comment.objects.order_by('id')]
+
+    def test_masks_old_comments(self):
+        """Старые комментарии маскируются по новому словарю."""
+        self.assertEqual(self.remoderate(fuzzy=True),
+                         ['Привет', 'Сам *******', '*******!'])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_exact_by_default(self):
+        """Без --fuzzy маскируются только слова словаря."""
+        self.assertEqual(self.remoderate(),
+                         ['Привет', 'Сам *******', 'Шалыгим!'])
+
+    def test_resumes_from_checkpoint(self):
+        """Прогон продолжается после сохранённого id."""
+        with open(self.checkpoint, 'w') as file:
+            file.write(str(self.comments[1].pk))
+        self.assertEqual(self.remoderate(fuzzy=True),
+                         ['Привет', 'Сам шалыгин', '*******!'])
+
+    def test_dry_run(self):
+        """--dry-run показывает замены и ничего не меняет."""
+        with open(self.checkpoint, 'w') as file:
+            file.write(str(self.comments[1].pk))
+        self.assertEqual(self.remoderate(fuzzy=True, dry_run=True),
+                         ['Привет', 'Сам шалыгин', 'Шалыгим!'])
+        self.assertIn(f"id {self.comments[1].pk}: 'Сам шалыгин' -> "
+                      f"'Сам *******'", self.out)
+        self.assertIn('будет изменено: 2', self.out)
+        with open(self.checkpoint) as file:
+            self.assertEqual(file.read(), str(self.comments[1].pk))
+
+    def test_save_skips_edited_comments(self):
+        """Комментарий, изменённый после чтения, не перезаписывается."""
+        comment = self.comments[1]
+        Comment.objects.filter(pk=comment.pk).update(text='Исправлено')
+        self.assertEqual(save([
+            (comment.pk, self.post.pk, 'Сам шалыгин', 'Сам *******'),
+        ]), 0)
+        comment.refresh_from_db()
+        self.assertEqual(comment.text, 'Исправлено')
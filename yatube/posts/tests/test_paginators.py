@@ -0,0 +1,63 @@
+from django.test import SimpleTestCase
+
+from posts.paginators import FeedPaginator
+
+PER_PAGE = 10
+
+
+class FeedPaginatorTests(SimpleTestCase):
+    def test_page_window(self):
+        """Вместо всех номеров страниц выдаётся окно вокруг текущей."""
+        paginator = FeedPaginator(list(range(1000)), PER_PAGE, count=1000)
+        page = paginator.get_page(50)
+        self.assertEqual(page.page_window(),
+                         [1, None, 48, 49, 50, 51, 52, None, 100])
+        page = paginator.get_page(2)
+        self.assertEqual(page.page_window(), [1, 2, 3, 4, None, 100])
+
+    def test_estimated_count_does_not_hide_rows(self):
+        """Заниженная оценка не мешает дойти до реальных постов."""
+        paginator = FeedPaginator(list(range(25)), PER_PAGE, count=0)
+        page = paginator.get_page(2)
+        self.assertEqual(list(page), list(range(10, 20)))
+        self.assertTrue(page.has_next())
+        page = paginator.get_page(3)
+        self.assertEqual(len(page), 5)
+        self.assertFalse(page.has_next())
+
+    def test_out_of_range_returns_last_page(self):
+        """Страница за концом ленты отдаёт последнюю страницу."""
+        paginator = FeedPaginator(list(range(25)), PER_PAGE, count=25)
+        page = paginator.get_page(7)
+        self.assertEqual(page.number, 3)
+        self.assertEqual(len(page), 5)
+
+    def test_overestimated_count(self):
+        """Оценка больше на много страниц не даёт пустых страниц."""
+        paginator = FeedPaginator(list(range(25)), PER_PAGE, count=100)
+        page = paginator.get_page(8)
+        self.assertEqual(page.number, 3)
+        self.assertEqual(list(page), list(range(20, 25)))
+        self.assertFalse(page.has_next())
+        self.assertEqual(page.page_window(), [1, 2, 3])
+
+    def test_unknown_total(self):
+        """Без итога следующая страница определяется лишней строкой."""
+        paginator = FeedPaginator(list(range(25)), PER_PAGE)
+        page = paginator.get_page(1)
+        self.assertTrue(page.has_next())
+        self.assertEqual(page.page_window(), [1, 2])
+        self.assertFalse(paginator.total_known)
+        page = FeedPaginator(list(range(25)), PER_PAGE).get_page(3)
+        self.assertFalse(page.has_next())
+        self.assertEqual(page.page_window(), [1, 2, 3])
+
+    def test_unknown_total_out_of_range(self):
+        """Без итога страница за концом ленты тоже отдаёт последнюю."""
+        page = FeedPaginator(list(range(25)), PER_PAGE).get_page(50)
+        self.assertEqual(page.number, 3)
+        self.assertEqual(list(page), list(range(20, 25)))
+        self.assertEqual(page.page_window(), [1, 2, 3])
+        page = FeedPaginator([], PER_PAGE).get_page(50)
+        self.assertEqual(page.number, 1)
+        self.assertEqual(page.page_window(), [1])
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+from posts import profanity
+from posts.forms import CommentForm
+
+
+class ProfanityTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'words.txt')
+        self.write('дура\nдурак\nгад')
+        settings = override_settings(BANNED_WORDS_FILE=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write(self, words, mtime=None):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write(words)
+        if mtime is not None:
+            os.utime(self.path, ns=(mtime, mtime))
+
+    @override_settings(BANNED_WORDS_MAX_DISTANCE=0)
+    def test_mask(self):
+        cases = {
+            'Ты ГАД!': 'Ты ***!',
+            'дурак': '****к',
+            'огад': 'о***',
+            'агад': 'агад',
+            'привет': 'привет',
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(profanity.mask(text), expected)
+
+    def test_reload_on_mtime_change(self):
+        self.write('гад', mtime=10 ** 18)
+        self.assertEqual(profanity.mask('кот'), 'кот')
+        self.write('кот', mtime=2 * 10 ** 18)
+        self.assertEqual(profanity.mask('кот'), '***')
+
+    def test_comment_form(self):
+        form = CommentForm(data={'text': 'Сам гад'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['text'], 'Сам ***')
+
+    def test_fuzzy(self):
+        """Опечатки и латинские двойники тоже маскируются."""
+        self.write('шалыгин\nдонцов')
+        cases = {
+            'шалыгим': '*******',
+            'шaлыгин!': '*******!',
+            'д0нцoвa': '******a',
+            'донцова': '******а',
+            'шалтай': 'шалтай',
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(profanity.mask(text), expected)
+
+    def test_fuzzy_keeps_common_words(self):
+        """Обычные слова рядом с короткими основами не маскируются."""
+        self.write('донцов\nлевицк\nшалыгин')
+        for text in ('в конце концов', 'гонцов', 'левица', 'малыгина'):
+            with self.subTest(text=text):
+                self.assertEqual(profanity.mask(text), text)
+
+    def test_fuzzy_anchored_prefix(self):
+        """Начало слова с другой первой буквой не совпадает."""
+        self.write('шалыгин')
+        self.assertEqual(profanity.mask('малыгин'), '*******')
+        self.assertEqual(profanity.mask('шалыгим'), '*******')
+        self.assertEqual(profanity.mask('шалыгима'), '*******а')
+
+    @override_settings(BANNED_WORDS_FUZZY_MAX_WORDS=2)
+    def test_fuzzy_word_limit(self):
+        """Слова сверх лимита проверяются только точно."""
+        self.write('шалыгин')
+        self.assertEqual(
+            profanity.mask('шалыгим шалыгим шалыгим шалыгин'),
+            '******* ******* шалыгим *******')
+
+    @override_settings(BANNED_WORDS_MAX_DISTANCE=0)
+    def test_fuzzy_disabled(self):
+        self.write('шалыгин')
+        self.assertEqual(profanity.mask('шалыгим'), 'шалыгим')
+
+    def test_fuzzy_index(self):
+        index = profanity.FuzzyIndex(['книга', 'книжка', 'кошка'], 1)
+        self.assertEqual(index.closest('кошко'), {4: 1, 5: 1})
+        self.assertEqual(index.closest('книжками')[6], 0)
+        self.assertEqual(profanity.FuzzyIndex(['кошка'], 2).closest(
+            'собака'), {})
+        short = profanity.FuzzyIndex(['кошка', 'книжка'], 1, exact_length=5)
+        self.assertEqual(short.closest('кошко'), {})
+        self.assertEqual(short.closest('книжко'), {5: 1, 6: 1})
@@ -0,0 +1,168 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.testing import OnCommitTestMixin, QueryBudgetTestMixin
+from posts.models import Comment, Follow, Group, Post, User
+
+NUM_OF_AUTHORS = 12
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='one',
+            description='Тестовое описание',
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        for i in range(NUM_OF_AUTHORS):
+            author = User.objects.create_user(username=f'author{i}')
+            post = Post.objects.create(
+                author=author, text='Тестовый пост', group=cls.group)
+            Comment.objects.create(
+                post=post, author=author, text='Тестовый комментарий')
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.post = Post.objects.create(
+            author=cls.reader, text='Тестовый пост', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(QueryBudgetTests.reader)
+
+    def test_get_pages_within_budget(self):
+        """Страницы не выходят за бюджет запросов и не делают N+1."""
+        post_id = QueryBudgetTests.post.pk
+        urls = (
+            reverse('posts:posts_list'),
+            reverse('posts:group_list', kwargs={
+                'slug': QueryBudgetTests.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'author1'}),
+            reverse('posts:post_detail', kwargs={'post_id': post_id}),
+            reverse('posts:post_comments', kwargs={'post_id': post_id}),
+            reverse('posts:post_create'),
+            reverse('posts:post_edit', kwargs={'post_id': post_id}),
+            reverse('posts:add_comment', kwargs={'post_id': post_id}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=тестовый',
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertWithinQueryBudget(self.client.get(url))
+
+    def test_writes_within_budget(self):
+        """Запись поста, комментария и подписки укладывается в бюджет."""
+        post_id = QueryBudgetTests.post.pk
+        requests = (
+            (reverse('posts:post_create'), {'text': 'Новый пост'}),
+            (reverse('posts:post_edit', kwargs={'post_id': post_id}),
+             {'text': 'Новый текст', 'group': QueryBudgetTests.group.pk}),
+            (reverse('posts:add_comment', kwargs={'post_id': post_id}),
+             {'text': 'Новый комментарий'}),
+            (reverse('posts:profile_unfollow', kwargs={
+                'username': 'author1'}), {}),
+            (reverse('posts:profile_follow', kwargs={
+                'username': 'author1'}), {}),
+        )
+        for url, data in requests:
+            with self.subTest(url=url):
+                self.assertWithinQueryBudget(self.client.post(url, data))
+
+
+class AdminChangelistTests(OnCommitTestMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='one', description='Описание')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(AdminChangelistTests.admin)
+
+    def add_rows(self, number):
+        for i in range(number):
+            author = User.objects.create_user(
+                username=f'author{User.objects.count()}')
+            post = Post.objects.create(
+                author=author, text='Тестовый пост',
+                group=AdminChangelistTests.group)
+            Comment.objects.create(
+                post=post, author=author, text='Тестовый комментарий')
+            Follow.objects.create(
+                user=AdminChangelistTests.admin, author=author)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_rows(self):
+        urls = [reverse(f'admin:posts_{model}_changelist')
+                for model in ('post', 'comment', 'follow')]
+        self.add_rows(2)
+        before = [self.count_queries(url) for url in urls]
+        self.add_rows(10)
+        self.assertEqual([self.count_queries(url) for url in urls], before)
+
+    def test_group_choices_shared_and_cached(self):
+        self.add_rows(3)
+        url = reverse('admin:posts_post_changelist')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse([query for query in queries
+                          if 'FROM "posts_group"' in query['sql']])
+        # По одному списку групп в каждой из трёх строк.
+        self.assertContains(response, 'Тестовая группа', count=3)
+        Group.objects.create(title='Новая группа', slug='two',
+                             description='Описание')
+        self.run_on_commit()
+        self.assertContains(self.client.get(url), 'Новая группа')
+
+    def test_id_filter(self):
+        self.add_rows(2)
+        post = Post.objects.first()
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'),
+            {'post__id__exact': post.pk})
+        comments = response.context['cl'].result_list
+        self.assertEqual([comment.post_id for comment in comments],
+                         [post.pk])
+        self.assertContains(response, str(post))
+
+    @override_settings(ADMIN_COUNT_LIMIT=3)
+    def test_count_limited(self):
+        self.add_rows(5)
+        response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertIsNone(response.context['cl'].full_result_count)
+        self.assertContains(response, '3+ Посты')
+
+    def test_count_dropped_after_admin_changes(self):
+        """Добавление и удаление через админку сбрасывают число строк."""
+        self.add_rows(2)
+        url = reverse('admin:posts_follow_changelist')
+        self.assertEqual(
+            self.client.get(url).context['cl'].result_count, 2)
+        author = User.objects.create_user(username='new')
+        self.client.post(reverse('admin:posts_follow_add'), {
+            'user': AdminChangelistTests.admin.pk, 'author': author.pk})
+        self.run_on_commit()
+        self.assertEqual(
+            self.client.get(url).context['cl'].result_count, 3)
+        self.client.post(url, {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': list(
+                Follow.objects.values_list('pk', flat=True)[:2]),
+        })
+        self.run_on_commit()
+        self.assertEqual(
+            self.client.get(url).context['cl'].result_count, 1)
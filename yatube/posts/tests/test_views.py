@@ -1,5 +1,10 @@
+import hashlib
 import shutil
 import tempfile
+from io import BytesIO, StringIO
+from collections import OrderedDict
+from itertools import count
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, override_settings
@@ -8,8 +13,18 @@ from django import forms
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
 
-from posts.models import Post, Group, Comment, Follow
+from core import metrics
+from core.testing import OnCommitTestMixin
+from core.tiered_cache import TieredCache
+from posts import feed_cache, search, thumbnails
+from posts.models import Post, Group, Comment, Follow, Timeline
+from posts.warmup import build_request
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -38,6 +53,9 @@ class PostPagesTests(TestCase):
             content=small_gif,
             content_type='image/gif'
         )
+        # Картинки хранятся под именем из хэша содержимого.
+        digest = hashlib.sha256(small_gif).hexdigest()
+        cls.image_name = f'posts/{digest[:2]}/{digest[2:]}.gif'
         cls.group = Group.objects.create(
             title='Тестовая группа',
             slug='one',
@@ -95,7 +113,7 @@ class PostPagesTests(TestCase):
         self.assertEqual(post_author_0, (
             PostPagesTests.post.author))
         self.assertEqual(post_group_0, PostPagesTests.group)
-        self.assertEqual(post_image_0.name, f'posts/{self.uploaded.name}')
+        self.assertEqual(post_image_0.name, self.image_name)
 
     def test_post_detail_pages_show_correct_context(self):
         """Шаблон post_detail сформирован с правильным контекстом."""
@@ -110,7 +128,7 @@ class PostPagesTests(TestCase):
         self.assertEqual(response.context.get('post').group,
                          PostPagesTests.group)
         self.assertEqual(response.context.get(
-            'post').image.name, f'posts/{self.uploaded.name}')
+            'post').image.name, self.image_name)
 
     def test_group_list_page_show_correct_context(self):
         """Шаблон group_list сформирован с правильным контекстом."""
@@ -130,7 +148,7 @@ class PostPagesTests(TestCase):
         group_object = response.context.get('group')
         self.assertEqual(group_object, (
             PostPagesTests.group))
-        self.assertEqual(post_image_0.name, f'posts/{self.uploaded.name}')
+        self.assertEqual(post_image_0.name, self.image_name)
 
     def test_profile_list_page_show_correct_context(self):
         """Шаблон profile_list сформирован с правильным контекстом."""
@@ -149,7 +167,7 @@ class PostPagesTests(TestCase):
         author_object = response.context.get('author')
         self.assertEqual(author_object, (
             PostPagesTests.post.author))
-        self.assertEqual(post_image_0.name, f'posts/{self.uploaded.name}')
+        self.assertEqual(post_image_0.name, self.image_name)
 
     def test_post_create_pages_show_correct_context(self):
         """Шаблон post_create сформирован с правильным контекстом."""
@@ -205,6 +223,9 @@ class PaginatorViewsTest(TestCase):
             )
         Post.objects.bulk_create(cls.post)
 
+    def setUp(self):
+        cache.clear()
+
     def test_paginator_page_contains_three_records(self):
         """Проверяем паждинатор для posts_list."""
         response = self.client.get(
@@ -242,34 +263,650 @@ class PaginatorViewsTest(TestCase):
             'page_obj']), NUM_OF_POSTS_CREATE - POSTS_PER_PAGE)
 
 
-class CacheTests(TestCase):
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, FEED_ROWS=True)
+class FeedRowsViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Лев', last_name='Толстой')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='one',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(FeedRowsViewsTest.user)
+
+    def test_feeds_render_rows(self):
+        """Ленты в режиме FEED_ROWS отдают компактные строки."""
+        urls = (
+            reverse('posts:posts_list'),
+            reverse('posts:group_list', kwargs={
+                'slug': FeedRowsViewsTest.group.slug}),
+            reverse('posts:profile', kwargs={
+                'username': FeedRowsViewsTest.user.username}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                row = response.context['page_obj'][0]
+                self.assertFalse(hasattr(row, '__dict__'))
+                self.assertEqual(row.text, FeedRowsViewsTest.post.text)
+                self.assertEqual(row.author.get_full_name(), 'Лев Толстой')
+                self.assertEqual(row.group.slug, FeedRowsViewsTest.group.slug)
+                self.assertContains(response, reverse(
+                    'posts:post_edit', kwargs={
+                        'post_id': FeedRowsViewsTest.post.pk}))
+
+    @override_settings(FEED_PAGINATION='cursor')
+    def test_rows_with_cursor_pagination(self):
+        """Компактные строки работают и с курсорной пагинацией."""
+        response = self.client.get(reverse('posts:posts_list'))
+        self.assertEqual(response.context['page_obj'][0].id,
+                         FeedRowsViewsTest.post.pk)
+
+
+@override_settings(FEED_PAGINATION='cursor')
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='one',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Тестовый пост {i}', author=cls.user, group=cls.group)
+            for i in range(NUM_OF_POSTS_CREATE)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pages_cover_feed(self):
+        """Курсоры ведут по ленте без пропусков и повторов."""
+        urls = (
+            reverse('posts:posts_list'),
+            reverse('posts:group_list', kwargs={
+                'slug': CursorPaginatorViewsTest.group.slug}),
+            reverse('posts:profile', kwargs={
+                'username': CursorPaginatorViewsTest.user.username}),
+        )
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.client.get(url).context['page_obj']
+                self.assertEqual(len(first), POSTS_PER_PAGE)
+                self.assertFalse(first.has_previous())
+                self.assertTrue(first.has_next())
+                second = self.client.get(
+                    url, {'cursor': first.next_cursor}).context['page_obj']
+                self.assertEqual(len(second),
+                                 NUM_OF_POSTS_CREATE - POSTS_PER_PAGE)
+                self.assertFalse(second.has_next())
+                self.assertEqual(list(first) + list(second), expected)
+                back = self.client.get(
+                    url, {'cursor': second.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+                self.assertFalse(back.has_previous())
+
+    def test_last_cursor(self):
+        """Курсор последней страницы отдаёт хвост ленты."""
+        first = self.client.get(
+            reverse('posts:posts_list')).context['page_obj']
+        last = self.client.get(reverse('posts:posts_list'), {
+            'cursor': first.last_cursor}).context['page_obj']
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        self.assertEqual(list(last), expected[-POSTS_PER_PAGE:])
+        self.assertFalse(last.has_next())
+        self.assertTrue(last.has_previous())
+
+    def test_bad_cursor_returns_first_page(self):
+        """Подделанный курсор отдаёт первую страницу."""
+        response = self.client.get(
+            reverse('posts:posts_list'), {'cursor': 'garbage'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), POSTS_PER_PAGE)
+        self.assertFalse(page_obj.has_previous())
+
+
+class CacheTests(OnCommitTestMixin, TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
         cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='cache',
+            description='Тестовое описание',
+        )
         cls.post = Post.objects.create(
             author=cls.user,
             text='Тестовый пост',
+            group=cls.group,
         )
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(CacheTests.user)
 
     def test_cache_index(self):
         """Тест кэширования страницы index.html"""
         first_state = self.authorized_client.get(reverse('posts:posts_list'))
-        post_1 = CacheTests.post
-        post_1.text = 'Измененный пост'
-        post_1.save()
+        # update() обходит сигналы, поэтому страница остаётся в кэше.
+        Post.objects.filter(pk=CacheTests.post.pk).update(
+            text='Измененный пост')
         second_state = self.authorized_client.get(reverse('posts:posts_list'))
         self.assertEqual(first_state.content, second_state.content)
         cache.clear()
         third_state = self.authorized_client.get(reverse('posts:posts_list'))
         self.assertNotEqual(first_state.content, third_state.content)
 
+    def test_cached_feeds_skip_database(self):
+        """Закэшированная лента не выбирает посты из базы."""
+        url = reverse('posts:group_list', kwargs={
+            'slug': CacheTests.group.slug})
+        self.authorized_client.get(url)
+        response = self.authorized_client.get(url)
+        shapes = response.wsgi_request.query_report.shapes
+        self.assertFalse(
+            [sql for sql in shapes if 'FROM "posts_post"' in sql])
+
+    def test_edits_invalidate_affected_feeds(self):
+        """Правка поста сразу видна во всех лентах, где он показан."""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=CacheTests.user)
+        reader_client = Client()
+        reader_client.force_login(reader)
+        urls = (
+            (self.authorized_client, reverse('posts:posts_list')),
+            (self.authorized_client, reverse('posts:group_list', kwargs={
+                'slug': CacheTests.group.slug})),
+            (self.authorized_client, reverse('posts:profile', kwargs={
+                'username': CacheTests.user.username})),
+            (reader_client, reverse('posts:follow_index')),
+        )
+        for client, url in urls:
+            client.get(url)
+        post = CacheTests.post
+        post.text = 'Измененный пост'
+        post.save()
+        self.run_on_commit()
+        for client, url in urls:
+            with self.subTest(url=url):
+                self.assertContains(client.get(url), 'Измененный пост')
 
-class CommentTests(TestCase):
+    def test_generations_bumped_after_commit(self):
+        """Поколения лент сдвигаются только после коммита правки."""
+        before = feed_cache.generations(feed_cache.INDEX)
+        post = CacheTests.post
+        post.text = 'Измененный пост'
+        post.save()
+        self.assertEqual(feed_cache.generations(feed_cache.INDEX), before)
+        self.run_on_commit()
+        self.assertNotEqual(
+            feed_cache.generations(feed_cache.INDEX), before)
+
+    def test_group_change_refreshes_cards(self):
+        """Новый адрес группы сразу виден в карточках главной."""
+        self.run_on_commit()
+        index = reverse('posts:posts_list')
+        self.assertContains(self.authorized_client.get(index), '/group/cache/')
+        group = Group.objects.get(pk=CacheTests.group.pk)
+        group.slug = 'renamed'
+        group.save()
+        self.run_on_commit()
+        response = self.authorized_client.get(index)
+        self.assertContains(response, '/group/renamed/')
+        self.assertNotContains(response, '/group/cache/')
+        group.delete()
+        self.run_on_commit()
+        self.assertNotContains(
+            self.authorized_client.get(index), '/group/renamed/')
+
+    def test_author_rename_refreshes_cards(self):
+        """Новое имя автора сразу видно на главной и в профиле."""
+        self.run_on_commit()
+        urls = (reverse('posts:posts_list'), reverse(
+            'posts:profile', kwargs={'username': CacheTests.user.username}))
+        for url in urls:
+            self.authorized_client.get(url)
+        user = User.objects.get(pk=CacheTests.user.pk)
+        user.first_name = 'Лев'
+        user.last_name = 'Толстой'
+        user.save()
+        self.run_on_commit()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(
+                    self.authorized_client.get(url), 'Лев Толстой')
+
+    def test_login_does_not_bump(self):
+        """Сохранение пользователя без смены имени ленты не трогает."""
+        before = feed_cache.generations(feed_cache.INDEX)
+        user = User.objects.get(pk=CacheTests.user.pk)
+        user.save(update_fields=['last_login'])
+        self.run_on_commit()
+        self.assertEqual(feed_cache.generations(feed_cache.INDEX), before)
+
+    def test_author_change_moves_post(self):
+        """Пост, переданный другому автору, переезжает во все его ленты."""
+        author = User.objects.create_user(username='new_author')
+        old_reader = User.objects.create_user(username='old_reader')
+        new_reader = User.objects.create_user(username='new_reader')
+        Follow.objects.create(user=old_reader, author=CacheTests.user)
+        Follow.objects.create(user=new_reader, author=author)
+        self.run_on_commit()
+        old_profile = reverse('posts:profile', kwargs={
+            'username': CacheTests.user.username})
+        new_profile = reverse('posts:profile', kwargs={
+            'username': author.username})
+        self.assertContains(self.authorized_client.get(old_profile),
+                            'Тестовый пост')
+        self.assertNotContains(self.authorized_client.get(new_profile),
+                               'Тестовый пост')
+        before = feed_cache.generations(
+            feed_cache.follow(old_reader.pk),
+            feed_cache.follow(new_reader.pk))
+        post = Post.objects.get(pk=CacheTests.post.pk)
+        post.author = author
+        post.save()
+        self.run_on_commit()
+        self.assertEqual(
+            list(Timeline.objects.filter(post=post).values_list(
+                'user_id', 'author_id')),
+            [(new_reader.pk, author.pk)])
+        after = feed_cache.generations(
+            feed_cache.follow(old_reader.pk),
+            feed_cache.follow(new_reader.pk))
+        self.assertNotEqual(before[0], after[0])
+        self.assertNotEqual(before[1], after[1])
+        self.assertNotContains(self.authorized_client.get(old_profile),
+                               'Тестовый пост')
+        self.assertContains(self.authorized_client.get(new_profile),
+                            'Тестовый пост')
+
+    def test_comment_bumps_only_its_post(self):
+        """Комментарий сдвигает поколение только своего поста."""
+        other = Post.objects.create(author=CacheTests.user, text='Другой')
+        self.run_on_commit()
+        before = feed_cache.generations(
+            feed_cache.INDEX, feed_cache.comments(other.pk))
+        Comment.objects.create(
+            post=CacheTests.post, author=CacheTests.user, text='Коммент')
+        self.run_on_commit()
+        after = feed_cache.generations(
+            feed_cache.INDEX, feed_cache.comments(other.pk))
+        self.assertEqual(before, after)
+        url = reverse('posts:post_detail', kwargs={
+            'post_id': CacheTests.post.pk})
+        self.assertContains(self.authorized_client.get(url), 'Коммент')
+
+
+class AnonymousPageCacheTests(OnCommitTestMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='pages',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+        cls.urls = (
+            reverse('posts:posts_list'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_page_follows_group_and_author(self):
+        """Страница поста обновляется после правки группы и автора."""
+        self.run_on_commit()
+        url = reverse('posts:post_detail', kwargs={
+            'post_id': AnonymousPageCacheTests.post.pk})
+        first = self.client.get(url)
+        feed_cache.bump(feed_cache.group(AnonymousPageCacheTests.group.pk))
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        group = Group.objects.get(pk=AnonymousPageCacheTests.group.pk)
+        group.title = 'Новое название'
+        group.save()
+        self.run_on_commit()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertContains(response, 'Новое название')
+        user = User.objects.get(pk=AnonymousPageCacheTests.user.pk)
+        user.first_name = 'Лев'
+        user.save()
+        self.run_on_commit()
+        self.assertContains(self.client.get(url), 'Лев')
+
+    def test_repeat_visit_skips_view(self):
+        """Повторный анонимный запрос отдаётся из кэша без шаблонов."""
+        for url in AnonymousPageCacheTests.urls:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    second = self.client.get(url)
+                # Не больше одного запроса: id группы, автора или поста.
+                self.assertLessEqual(len(queries), 1)
+                self.assertIsNone(second.context)
+                self.assertEqual(first.content, second.content)
+                self.assertEqual(first['ETag'], second['ETag'])
+        urls = len(AnonymousPageCacheTests.urls)
+        self.assertEqual(metrics.get('page_cache.misses'), urls)
+        self.assertEqual(metrics.get('page_cache.hits'), urls)
+
+    @override_settings(METRICS_FLUSH_INTERVAL=60)
+    def test_repeat_visit_does_not_write_cache(self):
+        """Счётчики попаданий не пишут в кэш на каждый запрос."""
+        self.run_on_commit()
+        url = AnonymousPageCacheTests.urls[0]
+        self.client.get(url)
+        with mock.patch.object(TieredCache, '_write', autospec=True,
+                               side_effect=TieredCache._write) as write:
+            for _ in range(3):
+                self.assertIsNone(self.client.get(url).context)
+        write.assert_not_called()
+        self.assertEqual(metrics.get('page_cache.hits'), 3)
+
+    def test_conditional_get(self):
+        """С актуальными валидаторами страница отвечает 304."""
+        for url in AnonymousPageCacheTests.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('Last-Modified', response)
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_edit_changes_validators(self):
+        """Правка поста меняет ETag и содержимое страниц."""
+        etags = {url: self.client.get(url)['ETag']
+                 for url in AnonymousPageCacheTests.urls}
+        post = AnonymousPageCacheTests.post
+        post.text = 'Измененный пост'
+        post.save()
+        self.run_on_commit()
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertContains(response, 'Измененный пост')
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_authorized_pages_not_cached(self):
+        """Страницы для авторизованных не кэшируются целиком."""
+        self.client.force_login(AnonymousPageCacheTests.user)
+        response = self.client.get(AnonymousPageCacheTests.urls[0])
+        self.assertNotIn('ETag', response)
+
+
+class WarmCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='warm',
+            description='Тестовое описание',
+        )
+        Post.objects.create(author=cls.user, text='Пост', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_cache(self):
+        """После прогрева анонимные страницы отдаются из кэша."""
+        out = StringIO()
+        call_command('warm_cache', workers=1, stdout=out)
+        self.assertIn('Прогрето страниц: 5.', out.getvalue())
+        urls = (
+            reverse('posts:posts_list'),
+            reverse('posts:group_list', kwargs={
+                'slug': WarmCacheTests.group.slug}),
+            reverse('posts:profile', kwargs={
+                'username': WarmCacheTests.user.username}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertIsNone(self.client.get(url).context)
+
+    def test_build_request_keeps_query(self):
+        """Ключ кэша прогретой страницы совпадает с ключом посетителя."""
+        request = build_request('/?page=2')
+        self.assertEqual(request.get_full_path(), '/?page=2')
+        self.assertEqual(request.GET['page'], '2')
+        self.assertFalse(request.user.is_authenticated)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAIL_WORKERS=0)
+class ThumbnailTests(OnCommitTestMixin, TestCase):
+    colors = count()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = self.create_post()
+
+    def create_post(self):
+        # Разные цвета дают разное содержимое, а значит и разные файлы.
+        buffer = BytesIO()
+        Image.new('RGB', (2, 1), (next(self.colors), 0, 0)).save(
+            buffer, 'PNG')
+        return Post.objects.create(
+            author=ThumbnailTests.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='thumb.png',
+                content=buffer.getvalue(),
+                content_type='image/png',
+            ),
+        )
+
+    def test_save_queues_thumbnails_after_commit(self):
+        """Миниатюры готовятся после коммита, а не во время сохранения."""
+        name = self.post.image.name
+        self.assertIsNone(thumbnails.lookup(name, 'card'))
+        self.run_on_commit()
+        thumbnail = thumbnails.lookup(name, 'card')
+        self.assertIsNotNone(thumbnail)
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+
+    def test_save_without_new_image_queues_nothing(self):
+        """Правка текста поста не ставит картинку в очередь заново."""
+        self.run_on_commit()
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        with mock.patch('posts.thumbnails.queue') as queue:
+            post.save()
+            self.run_on_commit()
+        queue.assert_not_called()
+
+    def test_template_does_not_wait_for_thumbnail(self):
+        """Пока миниатюры нет, лента показывает исходную картинку."""
+        with mock.patch('posts.thumbnails.queue') as queue:
+            response = self.client.get(reverse('posts:posts_list'))
+        queue.assert_called_once()
+        self.assertEqual(queue.call_args[0][0], self.post.image.name)
+        self.assertContains(response, self.post.image.url)
+        self.run_on_commit()
+        cache.clear()
+        response = self.client.get(reverse('posts:posts_list'))
+        self.assertContains(
+            response, thumbnails.lookup(self.post.image.name, 'card').url)
+
+    def test_thumbnail_name_matches_sorl(self):
+        """Имена и записи миниатюр совпадают с тем, что делает sorl.
+
+        thumbnails.thumbnail_name повторяет частные методы sorl: если
+        новая версия sorl назовёт файлы иначе, этот тест упадёт.
+        """
+        name = self.post.image.name
+        for preserve in (False, True):
+            for size in settings.POST_THUMBNAILS:
+                for variant in thumbnails.variants(size):
+                    with self.subTest(preserve=preserve, size=size,
+                                      variant=variant.geometry), \
+                            override_settings(
+                                THUMBNAIL_PRESERVE_FORMAT=preserve):
+                        thumbnail = get_thumbnail(
+                            name, variant.geometry, **variant.options)
+                        expected = thumbnails.thumbnail_name(name, variant)
+                        self.assertEqual(expected, thumbnail.name)
+                        cache.clear()
+                        stored = thumbnails.stored_many([expected])
+                        self.assertEqual(stored[expected].name,
+                                         thumbnail.name)
+                        self.assertEqual(
+                            stored[expected].size,
+                            default.kvstore.get(thumbnail).size)
+
+    def test_lookup_many_is_batched_and_memoized(self):
+        """Миниатюры страницы ищутся одним запросом и запоминаются."""
+        posts = [self.post, self.create_post(), self.create_post()]
+        self.run_on_commit()
+        names = [post.image.name for post in posts]
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            found = thumbnails.lookup_many(names, 'card')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            [(thumb.width, thumb.height) for thumb in found.values()],
+            [(960, 339)] * 3)
+        with mock.patch('posts.thumbnails.stored_many') as stored_many:
+            self.assertEqual(thumbnails.lookup_many(names, 'card'), found)
+        stored_many.assert_not_called()
+
+    def test_forget_in_other_process_invalidates_lru(self):
+        """После удаления миниатюр в другом процессе LRU им не верит."""
+        self.run_on_commit()
+        name = self.post.image.name
+        self.assertTrue(thumbnails.lookup(name, 'card').complete)
+        # Другой процесс снял последнюю ссылку: его LRU — не наш.
+        with mock.patch.object(thumbnails, '_resolved', OrderedDict()):
+            thumbnails.forget(name)
+        self.assertFalse(thumbnails.ready(name))
+        self.assertIsNone(thumbnails.lookup(name, 'card'))
+        with mock.patch('posts.thumbnails.generate') as generate:
+            thumbnails.queue(name)
+        generate.assert_called_once_with(name)
+
+    def test_feed_resolves_thumbnails_once(self):
+        """Лента спрашивает хранилище миниатюр один раз на страницу."""
+        self.create_post()
+        self.create_post()
+        self.run_on_commit()
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:posts_list'))
+        kvstore_queries = [query for query in queries.captured_queries
+                           if 'thumbnail_kvstore' in query['sql']]
+        self.assertLessEqual(len(kvstore_queries), 1)
+        self.assertContains(response, 'width="960" height="339"', count=3)
+
+    def test_thumbnail_variants(self):
+        """Каждая миниатюра готовится в нескольких ширинах для srcset."""
+        self.run_on_commit()
+        thumbnail = thumbnails.lookup(self.post.image.name, 'card')
+        self.assertTrue(thumbnail.complete)
+        for width in (*settings.POST_THUMBNAIL_WIDTHS, 960):
+            with self.subTest(width=width):
+                self.assertIn(f' {width}w', thumbnail.srcset)
+        self.assertEqual(
+            bool(thumbnail.webp_srcset), thumbnails.webp_supported())
+        response = self.client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}))
+        self.assertContains(response, f'srcset="{thumbnail.srcset}"')
+
+    def test_measure_images(self):
+        """measure_images сравнивает байты с srcset и без него."""
+        buffer = BytesIO()
+        Image.effect_noise((1200, 600), 64).convert('RGB').save(
+            buffer, 'PNG')
+        Post.objects.create(
+            author=ThumbnailTests.user,
+            text='Большая картинка',
+            image=SimpleUploadedFile(
+                name='big.png', content=buffer.getvalue(),
+                content_type='image/png'),
+        )
+        self.run_on_commit()
+        out = StringIO()
+        call_command('measure_images', viewports='360,1440', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'Картинок с готовыми миниатюрами: 2 из 2.')
+        self.assertIn('360 px', lines[1])
+        self.assertNotIn('меньше на 0%', lines[1])
+        self.assertIn('меньше на 0%', lines[2])
+
+    def test_identical_images_share_file_and_thumbnails(self):
+        """Одинаковые картинки хранятся одним файлом с одними миниатюрами."""
+        self.run_on_commit()
+        post = Post.objects.create(
+            author=ThumbnailTests.user,
+            text='Тот же мем',
+            image=SimpleUploadedFile(
+                'copy.png', self.post.image.read(), 'image/png'),
+        )
+        self.assertEqual(post.image.name, self.post.image.name)
+        with mock.patch('posts.thumbnails.generate') as generate:
+            self.run_on_commit()
+        generate.assert_not_called()
+        self.assertTrue(thumbnails.lookup(post.image.name, 'card').complete)
+
+    def test_last_reference_removes_image_and_thumbnails(self):
+        """Картинка и миниатюры удаляются вместе с последним постом."""
+        self.run_on_commit()
+        name = self.post.image.name
+        storage = self.post.image.storage
+        thumbnail_name = thumbnails.variant_files(
+            [name], 'card')[name][(960, None)].name
+        self.post.delete()
+        self.run_on_commit()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(storage.exists(thumbnail_name))
+        self.assertIsNone(thumbnails.lookup(name, 'card'))
+
+    def test_ready_thumbnail_refreshes_feeds(self):
+        """Готовые миниатюры сдвигают поколения лент поста."""
+        before = feed_cache.generations(feed_cache.INDEX)
+        self.run_on_commit()
+        self.assertNotEqual(
+            feed_cache.generations(feed_cache.INDEX), before)
+
+
+class CommentTests(OnCommitTestMixin, TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -348,8 +985,31 @@ class CommentTests(TestCase):
         self.assertEqual(response.context.get('comments')[0].author,
                          CommentTests.user)
 
+    @override_settings(NUM_OF_COMMENTS_ON_PAGE=5)
+    def test_post_detail_comments_bounded_queries(self):
+        """Комментарии выводятся страницами за постоянное число запросов."""
+        for i in range(12):
+            author = User.objects.create_user(username=f'commenter{i}')
+            Comment.objects.create(
+                post=CommentTests.post, author=author, text=f'Коммент {i}')
+        self.run_on_commit()
+        url = reverse('posts:post_detail', kwargs={
+            'post_id': CommentTests.post.pk})
+        with self.assertNumQueries(3):
+            response = self.guest_client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 5)
+        self.assertEqual(comments[0].text, 'Коммент 11')
+        self.assertEqual(comments.paginator.count, 12)
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={
+                'post_id': CommentTests.post.pk}), {'page': 3})
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        self.assertEqual([c.text for c in response.context['comments']],
+                         ['Коммент 1', 'Коммент 0'])
+
 
-class FollowTests(TestCase):
+class FollowTests(OnCommitTestMixin, TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -445,3 +1105,155 @@ class FollowTests(TestCase):
         response = self.authorized_client_3.get(reverse('posts:follow_index'))
         post_num = len(response.context['page_obj'])
         self.assertEqual(post_num, 0)
+
+    def test_timeline_backfill_and_purge(self):
+        """Подписка дозаполняет ленту постами автора, отписка очищает."""
+        self.authorized_client_1.post(
+            reverse('posts:profile_follow', kwargs={
+                'username': FollowTests.user.username})
+        )
+        self.assertTrue(Timeline.objects.filter(
+            user=self.user_1, post=FollowTests.post).exists())
+        response = self.authorized_client_1.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [FollowTests.post])
+        self.authorized_client_1.post(
+            reverse('posts:profile_unfollow', kwargs={
+                'username': FollowTests.user.username})
+        )
+        self.assertFalse(Timeline.objects.filter(user=self.user_1).exists())
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост записывается в ленты всех подписчиков автора."""
+        Follow.objects.create(user=self.user_1, author=self.user_3)
+        Follow.objects.create(user=self.user_2, author=self.user_3)
+        post = Post.objects.create(author=self.user_3, text='Новый пост')
+        self.assertEqual(
+            set(Timeline.objects.filter(post=post).values_list(
+                'user_id', flat=True)),
+            {self.user_1.pk, self.user_2.pk}
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_popular_author_posts_pulled_on_read(self):
+        """Посты автора выше порога подтягиваются в ленту при чтении."""
+        Follow.objects.create(user=self.user_1, author=self.user_3)
+        Follow.objects.create(user=self.user_2, author=self.user_3)
+        cache.clear()
+        post = Post.objects.create(author=self.user_3, text='Новый пост')
+        self.assertFalse(Timeline.objects.filter(post=post).exists())
+        self.assertEqual(metrics.get('timeline.pull.skipped_posts'), 1)
+        response = self.authorized_client_1.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+        self.assertEqual(metrics.get('timeline.pull.rows'), 1)
+        response = self.authorized_client_1.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+        self.assertEqual(metrics.get('timeline.pull.rows'), 1)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_author_below_limit_backfills_timelines(self):
+        """Посты, не подтянутые до спуска автора ниже порога, не теряются."""
+        Follow.objects.create(user=self.user_1, author=self.user_3)
+        Follow.objects.create(user=self.user_2, author=self.user_3)
+        cache.clear()
+        pulled = Post.objects.create(author=self.user_3, text='Подтянутый')
+        self.authorized_client_1.get(reverse('posts:follow_index'))
+        skipped = Post.objects.create(author=self.user_3, text='Пропущенный')
+        self.run_on_commit()
+        Follow.objects.filter(user=self.user_2).delete()
+        self.run_on_commit()
+        self.assertEqual(
+            list(Timeline.objects.filter(user=self.user_1).order_by(
+                'pub_date').values_list('post_id', flat=True)),
+            [pulled.pk, skipped.pk])
+        pushed = Post.objects.create(author=self.user_3, text='Разложенный')
+        self.assertTrue(Timeline.objects.filter(
+            user=self.user_1, post=pushed).exists())
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_superuser(
+            username='author', email='author@example.com', password='pass')
+        cls.in_comment = Post.objects.create(
+            author=cls.user, text='Пост о погоде')
+        Comment.objects.create(
+            post=cls.in_comment, author=cls.user, text='Котики лучше')
+        cls.in_text = Post.objects.create(
+            author=cls.user, text='Котики и снова котики')
+        cls.other = Post.objects.create(
+            author=cls.user, text='Пост о собаках')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(SearchTests.user)
+
+    def found(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        return [post.id for post in response.context['page_obj']]
+
+    def test_ranked_by_relevance(self):
+        """Совпадение в тексте поста выше совпадения в комментарии."""
+        self.assertEqual(
+            self.found('котик'),
+            [SearchTests.in_text.id, SearchTests.in_comment.id])
+
+    def test_all_words_required(self):
+        self.assertEqual(self.found('пост собаках'), [SearchTests.other.id])
+        # Слова ищутся в тексте поста или в одном комментарии.
+        self.assertEqual(self.found('пост котики'), [])
+
+    def test_query_syntax_is_escaped(self):
+        for query in ('"котики', 'котики OR (', 'NEAR(', '!!!', ''):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(
+                    reverse('posts:search'), {'q': query}).status_code, 200)
+
+    def test_index_follows_changes(self):
+        post = SearchTests.other
+        post.text = 'Пост о лошадях'
+        post.save()
+        self.assertEqual(self.found('собаках'), [])
+        self.assertEqual(self.found('лошадях'), [post.id])
+        post.delete()
+        self.assertEqual(self.found('лошадях'), [])
+
+    @override_settings(NUM_OF_POSTS_ON_PAGE=1)
+    def test_pagination_keeps_query(self):
+        response = self.client.get(reverse('posts:search'), {'q': 'котики'})
+        self.assertTrue(response.context['page_obj'].has_next())
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%82%D0%B8%D0%BA%D0'
+                                      '%B8&amp;page=2')
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'котики', 'page': 2})
+        self.assertEqual([post.id for post in response.context['page_obj']],
+                         [SearchTests.in_comment.id])
+
+    @override_settings(NUM_OF_POSTS_ON_PAGE=1)
+    def test_page_past_results_shows_last(self):
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'котики', 'page': 50})
+        page = response.context['page_obj']
+        self.assertEqual(page.number, 2)
+        self.assertEqual([post.id for post in page],
+                         [SearchTests.in_comment.id])
+        self.assertEqual(page.page_window(), [1, 2])
+
+    def test_admin_search_uses_index(self):
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собак'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [SearchTests.other])
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'), {'q': 'котики'})
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+
+    def test_lost_triggers_restored(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER posts_post_fts_insert')
+        self.assertTrue(search.ensure_index(connection))
+        self.assertFalse(search.ensure_index(connection))
+        post = Post.objects.create(author=SearchTests.user, text='Жирафы')
+        self.assertEqual(self.found('жирафы'), [post.id])
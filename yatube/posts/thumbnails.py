@@ -0,0 +1,316 @@
+"""Фоновая подготовка миниатюр картинок постов.
+
+Тег {% thumbnail %} из sorl при первом показе картинки декодирует и
+уменьшает её прямо во время запроса. Здесь миниатюры всех размеров из
+POST_THUMBNAILS готовятся в пуле потоков после коммита сохранения
+поста, а шаблоны через `lookup` только спрашивают хранилище ключей
+sorl, готова ли миниатюра. Пока её нет, шаблон показывает исходную
+картинку; когда миниатюры готовы, `on_ready` сдвигает поколения лент,
+чтобы закэшированные фрагменты перерисовались уже с ними.
+
+У каждого размера есть варианты: уменьшенные копии шириной
+POST_THUMBNAIL_WIDTHS с теми же пропорциями для srcset, и, если Pillow
+умеет WebP, те же ширины в WebP. Браузер сам выбирает самый лёгкий
+подходящий вариант, поэтому телефоны не качают картинку для экрана
+компьютера.
+
+`lookup_many` проверяет миниатюры целой страницы ленты одним чтением
+кэша (и одним запросом к базе для промахов), а готовые адреса и размеры
+запоминает в LRU процесса (POST_THUMBNAIL_CACHE_ENTRIES). Имя картинки —
+хэш содержимого, и после удаления последней ссылки та же картинка может
+загрузиться снова, уже без миниатюр. Поэтому у каждой картинки есть
+общее для всех процессов поколение (feed_cache), которое сдвигает
+`forget`: запись LRU со старым поколением считается промахом. `ready` и
+`queue` LRU не верят и спрашивают хранилище ключей sorl.
+"""
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from PIL import features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import metrics
+
+from . import feed_cache
+
+logger = logging.getLogger(__name__)
+
+WEBP = 'WEBP'
+
+# Вариант миниатюры: ширина, формат (None — формат sorl по умолчанию),
+# геометрия и опции для sorl.
+Variant = namedtuple('Variant', 'width format geometry options')
+# То, что получает шаблон. srcset и webp_srcset — пустые строки, если
+# вариантов нет; у исходной картинки вместо миниатюры нет и размеров.
+Thumbnail = namedtuple(
+    'Thumbnail', 'url width height srcset webp_srcset sizes complete')
+
+_pool = None
+_pending = set()
+_lock = threading.Lock()
+_resolved = OrderedDict()
+_resolved_lock = threading.Lock()
+
+
+def source_name(image):
+    """Имя файла картинки: у Post это FieldFile, у строк ленты — строка."""
+    return getattr(image, 'name', image) or None
+
+
+def webp_supported():
+    return features.check('webp')
+
+
+def variants(size):
+    """Варианты миниатюры размера `size`, первый — основной."""
+    geometry, options = settings.POST_THUMBNAILS[size]
+    width, height = (int(side) for side in geometry.split('x'))
+    widths = [width] + sorted(
+        {w for w in settings.POST_THUMBNAIL_WIDTHS if w < width},
+        reverse=True)
+    formats = [None, WEBP] if webp_supported() else [None]
+    result = []
+    for image_format in formats:
+        for variant_width in widths:
+            variant_options = dict(options)
+            if image_format is not None:
+                variant_options['format'] = image_format
+            variant_height = round(height * variant_width / width)
+            result.append(Variant(
+                variant_width, image_format,
+                f'{variant_width}x{variant_height}', variant_options))
+    return result
+
+
+def thumbnail_name(name, variant):
+    """Имя файла, которое get_thumbnail sorl даст варианту картинки `name`.
+
+    Публичного способа узнать его, не готовя миниатюру, у sorl нет,
+    поэтому здесь повторяется начало ThumbnailBackend.get_thumbnail с его
+    частными методами. Это единственное место, где они нужны: версия sorl
+    закреплена в requirements.txt, а test_thumbnail_name_matches_sorl
+    сравнивает результат с настоящим get_thumbnail и упадёт, если sorl
+    начнёт называть файлы иначе.
+    """
+    backend = default.backend
+    source = ImageFile(name)
+    options = dict(variant.options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return backend._get_thumbnail_filename(source, variant.geometry, options)
+
+
+def stored_many(names):
+    """{имя миниатюры: ImageFile} тех из `names`, что уже есть у sorl.
+
+    Хранилище кэш+база читается одним get_many по ключам ImageFile.key,
+    остальные — через публичный kvstore.get.
+    """
+    kvstore = default.kvstore
+    files = [ImageFile(name, default.storage) for name in names]
+    if not isinstance(kvstore, CachedDBStore):
+        found = ((image_file.name, kvstore.get(image_file))
+                 for image_file in files)
+        return {name: value for name, value in found if value}
+    keys = {add_prefix(image_file.key): image_file.name
+            for image_file in files}
+    found = kvstore.cache.get_many(list(keys))
+    missing = [key for key in keys if key not in found]
+    if missing:
+        rows = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        # Как и sorl, запоминаем и отсутствие ключа, чтобы не спрашивать
+        # базу снова; когда миниатюра появится, sorl перезапишет запись.
+        kvstore.cache.set_many(
+            {key: rows.get(key, EMPTY_VALUE) for key in missing},
+            sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(rows)
+    return {keys[key]: deserialize_image_file(value)
+            for key, value in found.items() if value is not EMPTY_VALUE}
+
+
+def _srcset(files, image_format):
+    return ', '.join(
+        f'{image_file.url} {width}w'
+        for (width, file_format), image_file in sorted(
+            files.items(), key=lambda item: item[0][0])
+        if file_format == image_format)
+
+
+def _thumbnail(size_variants, files):
+    """Thumbnail из готовых вариантов или None, если нет основного."""
+    main = files.get(size_variants[0][:2])
+    if main is None:
+        return None
+    return Thumbnail(
+        url=main.url,
+        width=main.width,
+        height=main.height,
+        srcset=_srcset(files, None),
+        webp_srcset=_srcset(files, WEBP),
+        sizes=f'(min-width: {main.width}px) {main.width}px, 100vw',
+        complete=len(files) == len(size_variants),
+    )
+
+
+def variant_files(names, size):
+    """{имя картинки: {(ширина, формат): ImageFile}} готовых вариантов."""
+    size_variants = variants(size)
+    thumbnails = {
+        thumbnail_name(name, variant): (name, variant)
+        for name in names for variant in size_variants
+    }
+    result = {name: {} for name in names}
+    for thumbnail, image_file in stored_many(list(thumbnails)).items():
+        name, variant = thumbnails[thumbnail]
+        result[name][variant[:2]] = image_file
+    return result
+
+
+def scope(name):
+    """Поколение картинки `name` в feed_cache; его сдвигает `forget`."""
+    return f'image:{name}'
+
+
+def lookup_many(names, size):
+    """{имя картинки: Thumbnail или None} для картинок `names`.
+
+    Миниатюры не готовятся; None — основной миниатюры ещё нет.
+    """
+    names = list(names)
+    generations = dict(zip(names, feed_cache.generations(
+        *(scope(name) for name in names))))
+    result = {}
+    with _resolved_lock:
+        for name in names:
+            entry = _resolved.get((name, size))
+            thumbnail = None
+            if entry is not None and entry[0] == generations[name]:
+                thumbnail = entry[1]
+                _resolved.move_to_end((name, size))
+            result[name] = thumbnail
+    missing = [name for name, thumbnail in result.items()
+               if thumbnail is None]
+    if not missing:
+        return result
+    size_variants = variants(size)
+    for name, files in variant_files(missing, size).items():
+        result[name] = _thumbnail(size_variants, files)
+    with _resolved_lock:
+        # Запоминаем только полные наборы: недостающие варианты ещё
+        # готовятся и скоро появятся.
+        for name in missing:
+            if result[name] is not None and result[name].complete:
+                _resolved[(name, size)] = (generations[name], result[name])
+        while len(_resolved) > settings.POST_THUMBNAIL_CACHE_ENTRIES:
+            _resolved.popitem(last=False)
+    return result
+
+
+def lookup(name, size):
+    """Готовая миниатюра размера `size` или None; картинку не трогает."""
+    return lookup_many([name], size)[name]
+
+
+def ready(name):
+    """Готовы ли все варианты всех размеров картинки `name`.
+
+    Отвечает хранилище ключей sorl, а не LRU процесса.
+    """
+    for size in settings.POST_THUMBNAILS:
+        files = variant_files([name], size)[name]
+        if len(files) < len(variants(size)):
+            return False
+    return True
+
+
+def generate(name):
+    """Готовит все варианты всех размеров POST_THUMBNAILS картинки `name`."""
+    for size in settings.POST_THUMBNAILS:
+        for variant in variants(size):
+            get_thumbnail(name, variant.geometry, **variant.options)
+    metrics.incr('thumbnails.generated')
+
+
+def _run(name, on_ready):
+    try:
+        generate(name)
+        if on_ready is not None:
+            on_ready()
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры %s', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+
+
+def _work(name, on_ready):
+    try:
+        _run(name, on_ready)
+    finally:
+        # У потока пула своё соединение с базой.
+        connection.close()
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                settings.POST_THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+        return _pool
+
+
+def queue(name, on_ready=None):
+    """Ставит картинку в очередь; повторная постановка ничего не делает.
+
+    `on_ready()` вызывается после того, как миниатюры готовы. Если
+    все они уже есть (например, у такой же картинки другого поста),
+    ничего не делается.
+    """
+    if ready(name):
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    metrics.incr('thumbnails.queued')
+    if settings.POST_THUMBNAIL_WORKERS <= 0:
+        _run(name, on_ready)
+    else:
+        _get_pool().submit(_work, name, on_ready)
+
+
+def forget(name):
+    """Удаляет миниатюры картинки `name` и их записи у sorl и в LRU.
+
+    Записи LRU других процессов устаревают через поколение картинки.
+    """
+    default.kvstore.delete(ImageFile(name, default.storage))
+    feed_cache.bump(scope(name))
+    with _resolved_lock:
+        for key in [key for key in _resolved if key[0] == name]:
+            del _resolved[key]
+
+
+def schedule(name, on_ready=None):
+    """Ставит картинку в очередь после коммита текущей транзакции."""
+    transaction.on_commit(lambda: queue(name, on_ready))
@@ -0,0 +1,184 @@
+"""Материализованные ленты подписок (гибрид fan-out on write / on read).
+
+Пост автора, у которого меньше TIMELINE_FANOUT_LIMIT подписчиков,
+копируется в ленты подписчиков в момент публикации. Посты авторов
+с большим числом подписчиков при публикации никуда не пишутся: читатель
+подтягивает их в свою ленту сам, когда открывает «Избранных авторов».
+При подписке лента читателя дозаполняется постами автора, при отписке —
+очищается.
+
+Когда автор опускается ниже порога, его посты, которые подписчики ещё не
+подтянули, дописываются в их ленты (см. stop_pulling): дальше при чтении
+этого автора уже никто не подтягивает.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Q
+
+from core import metrics
+from .models import FEED_FIELDS, AuthorStats, Follow, Post, Timeline
+
+PULL_AUTHORS_KEY = 'timeline:pull_authors'
+
+
+def _bulk_insert(entries):
+    """Пишет записи ленты пачками и возвращает их число."""
+    return len(Timeline.objects.bulk_create(
+        entries,
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    ))
+
+
+def pull_authors():
+    """Авторы, чьи посты подтягиваются в ленты при чтении."""
+    authors = cache.get(PULL_AUTHORS_KEY)
+    if authors is None:
+        authors = set(
+            AuthorStats.objects.filter(
+                followers_count__gte=settings.TIMELINE_FANOUT_LIMIT
+            ).values_list('user_id', flat=True)
+        )
+        cache.set(PULL_AUTHORS_KEY, authors,
+                  settings.TIMELINE_PULL_AUTHORS_TIMEOUT)
+    return authors
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if post.author_id in pull_authors():
+        metrics.incr('timeline.pull.skipped_posts')
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    with transaction.atomic():
+        rows = _bulk_insert(
+            Timeline(user_id=user_id, post_id=post.pk,
+                     author_id=post.author_id, pub_date=post.pub_date)
+            for user_id in followers.iterator()
+        )
+    metrics.incr('timeline.push.posts')
+    metrics.incr('timeline.push.rows', rows)
+
+
+def reassign_post(post):
+    """Переносит пост, переданный другому автору, в ленты его подписчиков.
+
+    Пост раскладывается даже авторам выше порога: при чтении подтянутся
+    только посты новее уже подтянутых, а этот мог быть опубликован давно.
+    """
+    Timeline.objects.filter(post_id=post.pk).delete()
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    with transaction.atomic():
+        _bulk_insert(
+            Timeline(user_id=user_id, post_id=post.pk,
+                     author_id=post.author_id, pub_date=post.pub_date)
+            for user_id in followers.iterator()
+        )
+
+
+def stop_pulling(author_id):
+    """Переводит автора, опустившегося ниже порога, на раскладку постов.
+
+    Каждому подписчику дописываются посты автора новее последнего
+    подтянутого им, а множество авторов для подтягивания пересчитывается,
+    чтобы следующие посты автора раскладывались при публикации.
+    Возвращает подписчиков, чьи ленты изменились.
+    """
+    cache.delete(PULL_AUTHORS_KEY)
+    followers = list(Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
+    if not followers:
+        return set()
+    last_seen = dict(
+        Timeline.objects.filter(
+            author_id=author_id, user_id__in=followers
+        ).values('user_id').annotate(
+            last=Max('pub_date')
+        ).values_list('user_id', 'last')
+    )
+    posts = Post.objects.filter(author_id=author_id)
+    if len(last_seen) == len(followers):
+        posts = posts.filter(pub_date__gt=min(last_seen.values()))
+    posts = list(posts.values_list('id', 'pub_date'))
+    entries = [
+        Timeline(user_id=user_id, post_id=post_id,
+                 author_id=author_id, pub_date=pub_date)
+        for user_id in followers
+        for post_id, pub_date in posts
+        if user_id not in last_seen or pub_date > last_seen[user_id]
+    ]
+    with transaction.atomic():
+        rows = _bulk_insert(entries)
+    metrics.incr('timeline.backfill.rows', rows)
+    return {entry.user_id for entry in entries}
+
+
+def pull(user):
+    """Подтягивает в ленту читателя новые посты авторов выше порога.
+
+    Возвращает список таких авторов, на которых подписан читатель.
+    """
+    authors = pull_authors()
+    if not authors:
+        return []
+    followed = list(Follow.objects.filter(
+        user=user, author_id__in=authors
+    ).values_list('author_id', flat=True))
+    if not followed:
+        return followed
+    last_seen = dict(
+        Timeline.objects.filter(
+            user=user, author_id__in=followed
+        ).values('author_id').annotate(
+            last=Max('pub_date')
+        ).values_list('author_id', 'last')
+    )
+    condition = Q()
+    for author_id in followed:
+        if author_id in last_seen:
+            condition |= Q(author_id=author_id,
+                           pub_date__gt=last_seen[author_id])
+        else:
+            condition |= Q(author_id=author_id)
+    posts = Post.objects.filter(condition).values_list(
+        'id', 'author_id', 'pub_date')
+    with transaction.atomic():
+        rows = _bulk_insert(
+            Timeline(user_id=user.pk, post_id=post_id,
+                     author_id=author_id, pub_date=pub_date)
+            for post_id, author_id, pub_date in posts.iterator()
+        )
+    metrics.incr('timeline.pull.reads')
+    metrics.incr('timeline.pull.authors', len(followed))
+    metrics.incr('timeline.pull.rows', rows)
+    return followed
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту читателя уже опубликованные посты автора."""
+    posts = Post.objects.filter(
+        author_id=author_id).values_list('id', 'pub_date')
+    with transaction.atomic():
+        rows = _bulk_insert(
+            Timeline(user_id=user_id, post_id=post_id,
+                     author_id=author_id, pub_date=pub_date)
+            for post_id, pub_date in posts.iterator()
+        )
+    metrics.incr('timeline.backfill.rows', rows)
+
+
+def purge(user_id, author_id):
+    """Убирает посты автора из ленты читателя после отписки."""
+    Timeline.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def timeline_for(user):
+    """Лента подписок читателя в порядке (pub_date, post_id)."""
+    return Timeline.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    ).only(
+        'pub_date', 'post', *(f'post__{field}' for field in FEED_FIELDS)
+    ).order_by('-pub_date', '-post_id')
@@ -0,0 +1,137 @@
+"""Приём картинок постов с ограниченным расходом памяти.
+
+Views создания и правки поста ставят BoundedUploadHandler (`attach`)
+первым обработчиком загрузки: он пишет файл кусками во временный файл
+и обрывает загрузку, как только она превысила
+POST_IMAGE_MAX_UPLOAD_SIZE байт. PostForm тогда показывает ошибку
+размера, а не получает обрезанный файл. Картинки, у которых по
+заголовку больше POST_IMAGE_MAX_PIXELS пикселей, форма отклоняет ещё
+до декодирования. Принятый JPEG декодируется в режиме draft: сразу
+в уменьшенном в 2, 4 или 8 раз виде, поэтому в памяти никогда не
+оказывается полноразмерный исходник. Затем картинка поворачивается по
+EXIF, уменьшается до POST_IMAGE_MAX_SIDE и пересохраняется без
+метаданных. Анимации и форматы, кроме JPEG и PNG, сохраняются как есть.
+"""
+import tempfile
+import warnings
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (
+    StopFutureHandlers, StopUpload, TemporaryFileUploadHandler)
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+# Форматы, которые пересохраняются, и параметры их сохранения.
+REENCODE = {
+    'JPEG': lambda: {'quality': settings.POST_IMAGE_QUALITY,
+                     'optimize': True, 'progressive': True},
+    'PNG': lambda: {'optimize': True},
+}
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку на диск, но не больше POST_IMAGE_MAX_UPLOAD_SIZE.
+
+    Превысив предел, обрывает загрузку без чтения остатка запроса и
+    отмечает это в `exceeded`; недокачанный файл в request.FILES не
+    попадает.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.exceeded = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        # Файл целиком наш: остальным обработчикам его не отдаём.
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+            self.exceeded = True
+            raise StopUpload(connection_reset=True)
+        self.file.write(raw_data)
+
+
+def attach(request):
+    """Ставит BoundedUploadHandler первым обработчиком загрузки запроса.
+
+    Вызывается до первого обращения к request.POST и request.FILES.
+    """
+    handler = BoundedUploadHandler(request)
+    request.upload_handlers.insert(0, handler)
+    return handler
+
+
+def _source(data):
+    if hasattr(data, 'temporary_file_path'):
+        return data.temporary_file_path()
+    data.seek(0)
+    return data
+
+
+def ingest(upload):
+    """Уменьшенная копия картинки без метаданных или сама `upload`."""
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    with Image.open(_source(upload)) as image:
+        image_format = image.format
+        if (image_format not in REENCODE
+                or getattr(image, 'is_animated', False)):
+            upload.seek(0)
+            return upload
+        if image_format == 'JPEG':
+            image.draft(image.mode, (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side))
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    # Безымянный временный файл: хранилище копирует его кусками, а после
+    # запроса он удаляется сам.
+    result = UploadedFile(
+        tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR),
+        upload.name, Image.MIME[image_format])
+    # Цветовой профиль нужен, чтобы картинка выглядела так же; EXIF,
+    # XMP и комментарии не сохраняются.
+    image.save(result, image_format,
+               icc_profile=image.info.get('icc_profile'),
+               **REENCODE[image_format]())
+    result.size = result.tell()
+    result.seek(0)
+    return result
+
+
+def too_large():
+    return forms.ValidationError(
+        'Файл больше %(limit)s.', code='too_large',
+        params={'limit': filesizeformat(settings.POST_IMAGE_MAX_UPLOAD_SIZE)})
+
+
+def check_size(upload):
+    if upload.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+        raise too_large()
+
+
+def check_pixels(upload):
+    """Отклоняет картинку, у которой по заголовку слишком много пикселей."""
+    # Image.open читает только заголовок. Своё ограничение строже
+    # встроенного в Pillow, поэтому его предупреждение не нужно.
+    limit = settings.POST_IMAGE_MAX_PIXELS
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(_source(upload)) as image:
+                width, height = image.size
+        too_many = width * height > limit
+    except Image.DecompressionBombError:
+        too_many = True
+    finally:
+        upload.seek(0)
+    if too_many:
+        raise forms.ValidationError(
+            'Картинка больше %(limit)s мегапикселей.',
+            code='too_many_pixels',
+            params={'limit': f'{limit / 10 ** 6:g}'})
@@ -1,43 +1,69 @@
-from django.core.paginator import Paginator
+from operator import attrgetter
+from urllib.parse import urlencode
+
 from django.shortcuts import redirect, render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
 from django.conf import settings
+from django.db import transaction
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 
+from . import feed_cache, page_cache, uploads
 from .forms import PostForm, CommentForm
 from .models import Follow, Post, Group, User
-
-
-def paginators(posts, page_number):
-    paginator = Paginator(posts, settings.NUM_OF_POSTS_ON_PAGE)
-    page_obj = paginator.get_page(page_number)
+from .paginators import CursorPaginator, FeedPaginator, cached_count
+from .search import SearchResults
+from .timeline import pull, timeline_for
+
+
+def paginators(posts, request, id_field='id', count=None, transform=None):
+    if settings.FEED_PAGINATION == 'cursor':
+        paginator = CursorPaginator(
+            posts, settings.NUM_OF_POSTS_ON_PAGE, id_field=id_field,
+            transform=transform)
+        return paginator.get_page(request.GET.get('cursor'))
+    paginator = FeedPaginator(posts, settings.NUM_OF_POSTS_ON_PAGE,
+                              count=count, window=settings.PAGINATOR_WINDOW,
+                              transform=transform)
+    page_obj = paginator.get_page(request.GET.get('page'))
     return page_obj
 
 
+@page_cache.anonymous_page_cache(page_cache.index_scopes)
 def index(request):
-    posts = Post.objects.select_related('group').all()
-    page_number = request.GET.get('page')
-    page_obj = paginators(posts, page_number)
-    return render(request, 'posts/index.html', {'page_obj': page_obj})
+    posts = Post.objects.feed(rows=settings.FEED_ROWS)
+    count = cached_count('index', posts, settings.FEED_COUNT_TIMEOUT)
+    page_obj = paginators(posts, request, count=count)
+    context = {
+        'page_obj': page_obj,
+        **feed_cache.context(
+            request, [feed_cache.INDEX], viewer=request.user.pk),
+    }
+    return render(request, 'posts/index.html', context)
 
 
+@page_cache.anonymous_page_cache(page_cache.group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('group').all()
-    page_number = request.GET.get('page')
-    page_obj = paginators(posts, page_number)
+    posts = group.posts.feed(rows=settings.FEED_ROWS)
+    page_obj = paginators(posts, request, count=group.posts_count)
     context = {
         'page_obj': page_obj,
         'group': group,
+        **feed_cache.context(
+            request, [feed_cache.group(group.pk)], viewer=request.user.pk),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@page_cache.anonymous_page_cache(page_cache.profile_scopes)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    posts = user.posts.select_related('group').all()
-    page_number = request.GET.get('page')
-    page_obj = paginators(posts, page_number)
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    posts = user.posts.feed(rows=settings.FEED_ROWS)
+    stats = getattr(user, 'stats', None)
+    page_obj = paginators(
+        posts, request, count=stats.posts_count if stats else None)
     if request.user.is_authenticated:
         following = request.user.is_authenticated and Follow.objects.filter(
             user=request.user, author=user)
@@ -49,27 +75,76 @@ def profile(request, username):
     context = {
         'author': user,
         'page_obj': page_obj,
+        **feed_cache.context(
+            request, [feed_cache.profile(user.pk)],
+            viewer=request.user == user),
     }
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = FeedPaginator(
+        SearchResults(query, rows=settings.FEED_ROWS),
+        settings.NUM_OF_POSTS_ON_PAGE, window=settings.PAGINATOR_WINDOW)
+    context = {
+        'query': query,
+        'page_obj': paginator.get_page(request.GET.get('page')),
+        'page_params': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def comments_page(post, request):
+    comments = post.comments.select_related('author')
+    paginator = FeedPaginator(comments, settings.NUM_OF_COMMENTS_ON_PAGE,
+                              count=post.comments_count,
+                              window=settings.PAGINATOR_WINDOW)
+    return {
+        'comments': paginator.get_page(request.GET.get('page')),
+        **feed_cache.context(request, [feed_cache.comments(post.pk)],
+                             prefix='comments'),
+    }
+
+
+@page_cache.anonymous_page_cache(page_cache.post_scopes)
 def post_detail(request, post_id):
     post = get_object_or_404(
-        Post.objects.select_related('group', 'author'), id=post_id)
-    comments = post.comments.select_related('post').all()
+        Post.objects.select_related('group', 'author__stats'), id=post_id)
     form = CommentForm()
     context = {
         'post': post,
         'form': form,
-        'comments': comments
+        **comments_page(post, request),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    post = get_object_or_404(
+        Post.objects.only('id', 'comments_count'), id=post_id)
+    context = {
+        'post': post,
+        **comments_page(post, request),
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
+# Обработчик загрузки можно поменять только до чтения тела запроса, а
+# CsrfViewMiddleware читает его раньше view. Поэтому CSRF проверяется
+# внутри, уже после uploads.attach, как советует документация Django.
+@csrf_exempt
 @login_required
 def post_create(request):
+    return _post_create(request, uploads.attach(request))
+
+
+@csrf_protect
+@transaction.atomic
+def _post_create(request, upload):
     form = PostForm(request.POST or None,
                     files=request.FILES or None,
+                    upload_too_large=upload.exceeded,
                     )
     if form.is_valid():
         post = form.save(commit=False)
@@ -79,14 +154,22 @@ def post_create(request):
     return render(request, 'posts/create_post.html', {'form': form})
 
 
+@csrf_exempt
 @login_required
 def post_edit(request, post_id):
+    return _post_edit(request, post_id, uploads.attach(request))
+
+
+@csrf_protect
+@transaction.atomic
+def _post_edit(request, post_id, upload):
     post = get_object_or_404(Post, id=post_id)
     if request.user != post.author:
         return redirect('posts:post_detail', post_id)
     form = PostForm(request.POST or None,
                     files=request.FILES or None,
-                    instance=post
+                    instance=post,
+                    upload_too_large=upload.exceeded,
                     )
     if form.is_valid():
         post = form.save()
@@ -108,20 +191,31 @@ def add_comment(request, post_id):
         comment.post = post
         comment.save()
         return redirect('posts:post_detail', post_id)
-    return render(request, 'posts/includes/comments.html', {'form': form,
-                  'post': post})
+    context = {
+        'form': form,
+        'post': post,
+        **comments_page(post, request),
+    }
+    return render(request, 'posts/includes/comments.html', context)
 
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_number = request.GET.get('page')
-    page_obj = paginators(posts, page_number)
-    context = {'page_obj': page_obj}
+    pulled = pull(request.user)
+    entries = timeline_for(request.user)
+    page_obj = paginators(entries, request, id_field='post_id',
+                          transform=attrgetter('post'))
+    scopes = [feed_cache.follow(request.user.pk)]
+    scopes += [feed_cache.profile(author_id) for author_id in pulled]
+    context = {
+        'page_obj': page_obj,
+        **feed_cache.context(request, scopes),
+    }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     user = request.user
     author = User.objects.get(username=username)
@@ -131,6 +225,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     Follow.objects.filter(user=request.user, author=author).delete()
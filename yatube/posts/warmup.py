@@ -0,0 +1,76 @@
+"""Прогрев кэша лент после деплоя или перезапуска.
+
+Страницы рисуются так же, как для анонимного читателя, поэтому в кэш
+попадают и целые страницы (posts.page_cache), и фрагменты лент.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.http import HttpRequest, QueryDict
+from django.urls import resolve, reverse
+
+from .models import Group, User
+
+
+def urls(pages, groups, authors):
+    """Страницы, которые посетители открывают первыми."""
+    index = reverse('posts:posts_list')
+    result = [index]
+    if settings.FEED_PAGINATION == 'page':
+        result += [f'{index}?page={number}' for number in range(2, pages + 1)]
+    slugs = Group.objects.order_by('-posts_count').values_list(
+        'slug', flat=True)[:groups]
+    result += [reverse('posts:group_list', kwargs={'slug': slug})
+               for slug in slugs]
+    usernames = User.objects.order_by(
+        '-stats__followers_count').values_list('username', flat=True)[:authors]
+    result += [reverse('posts:profile', kwargs={'username': username})
+               for username in usernames]
+    return result
+
+
+def build_request(url):
+    """GET-запрос анонима к `url` без middleware и django.test."""
+    path, _, query = url.partition('?')
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = path
+    request.GET = QueryDict(query)
+    request.META = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+    }
+    request.user = AnonymousUser()
+    return request
+
+
+def render(url):
+    """Рисует страницу `url` для анонима; возвращает (url, код, секунды)."""
+    start = time.perf_counter()
+    request = build_request(url)
+    match = resolve(request.path_info)
+    request.resolver_match = match
+    response = match.func(request, *match.args, **match.kwargs)
+    return url, response.status_code, time.perf_counter() - start
+
+
+def _render_in_thread(url):
+    try:
+        return render(url)
+    finally:
+        connection.close()
+
+
+def warm(pages, groups, authors, workers):
+    """Прогревает страницы пулом из `workers` потоков."""
+    targets = urls(pages, groups, authors)
+    if workers <= 1:
+        return [render(url) for url in targets]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render_in_thread, targets))
@@ -12,6 +12,77 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 NUM_OF_POSTS_ON_PAGE: int = 10
+NUM_OF_COMMENTS_ON_PAGE: int = 20
+# Словарь слов, которые маскируются в комментариях (posts.profanity).
+BANNED_WORDS_FILE = os.path.join(BASE_DIR, 'posts', 'bed_author.txt')
+# Нечёткий поиск: допустимое расстояние Левенштейна (0 — выключен),
+# минимальная длина проверяемого слова и сколько слов комментария
+# проверять. Слова словаря не длиннее BANNED_WORDS_EXACT_MAX_LENGTH букв
+# ищутся без опечаток: одна замена в короткой основе даёт обычное слово.
+BANNED_WORDS_MAX_DISTANCE: int = 1
+BANNED_WORDS_FUZZY_MIN_LENGTH: int = 4
+BANNED_WORDS_FUZZY_MAX_WORDS: int = 500
+BANNED_WORDS_EXACT_MAX_LENGTH: int = 6
+# manage.py remoderate_comments: файл, в котором хранится id последнего
+# проверенного комментария.
+REMODERATION_CHECKPOINT = os.path.join(BASE_DIR, '.remoderate_comments')
+# 'page' — классические номера страниц, 'cursor' — keyset-пагинация
+# по (pub_date, id): глубокие страницы не дороже первой.
+FEED_PAGINATION: str = 'page'
+# True — ленты отдают шаблону компактные FeedRow вместо моделей Post.
+FEED_ROWS: bool = False
+# Сколько номеров страниц показывать по обе стороны от текущей.
+PAGINATOR_WINDOW: int = 2
+# Сколько секунд живёт закэшированное число постов главной страницы.
+FEED_COUNT_TIMEOUT: int = 60
+# Сколько секунд хранятся фрагменты лент. Правки сбрасывают их сразу
+# через поколения (posts.feed_cache), поэтому срок может быть долгим.
+FEED_CACHE_TIMEOUT: int = 60 * 60 * 24
+# То же для целых страниц, которые отдаются анонимным читателям.
+PAGE_CACHE_TIMEOUT: int = 60 * 60 * 24
+# Сколько секунд после мягкого срока хранится устаревшая копия, которую
+# отдают, пока один запрос её обновляет (core.swr).
+SWR_STALE_TIMEOUT: int = 60 * 60
+# Срок блокировки обновления, если обновляющий процесс упал.
+SWR_LOCK_TIMEOUT: int = 30
+# Сколько секунд ждать чужого обновления, если копии нет совсем,
+# и как часто проверять, не появилась ли она.
+SWR_LOCK_WAIT: float = 2.0
+SWR_LOCK_POLL: float = 0.05
+# Прогрев кэша (manage.py warm_cache): сколько страниц главной, групп
+# и авторов рисовать и сколькими потоками. С WARM_CACHE_ON_STARTUP
+# процесс прогревает кэш в wsgi.py до того, как начнёт принимать запросы.
+WARM_CACHE_PAGES: int = 3
+WARM_CACHE_GROUPS: int = 10
+WARM_CACHE_AUTHORS: int = 10
+WARM_CACHE_WORKERS: int = 4
+WARM_CACHE_ON_STARTUP: bool = False
+# Миниатюры картинок постов, которые используют шаблоны: имя размера ->
+# (геометрия, опции sorl). Они готовятся в фоне после сохранения поста.
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# Ширины уменьшенных копий каждой миниатюры для srcset. Если Pillow
+# умеет WebP, все ширины готовятся ещё и в WebP.
+POST_THUMBNAIL_WIDTHS = (320, 480, 720)
+# Сколько потоков готовят миниатюры; 0 — прямо в вызвавшем потоке.
+POST_THUMBNAIL_WORKERS: int = 2
+# Сколько адресов и размеров готовых миниатюр помнит каждый процесс.
+POST_THUMBNAIL_CACHE_ENTRIES: int = 10000
+# Приём картинок постов (posts.uploads): наибольший размер файла,
+# наибольшее число пикселей по заголовку, сторона, до которой
+# уменьшается исходник, и качество пересохранённого JPEG.
+POST_IMAGE_MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS: int = 50_000_000
+POST_IMAGE_MAX_SIDE: int = 2048
+POST_IMAGE_QUALITY: int = 85
+# Размер пачки INSERT при раскладке постов по лентам подписчиков.
+TIMELINE_BATCH_SIZE: int = 500
+# Посты авторов, у которых подписчиков не меньше этого числа, не
+# раскладываются по лентам при публикации, а подтягиваются при чтении.
+TIMELINE_FANOUT_LIMIT: int = 10000
+# Как долго (в секундах) кэшируется список таких авторов.
+TIMELINE_PULL_AUTHORS_TIMEOUT: int = 300
 NUM_OF_STR: int = 15
 
 ALLOWED_HOSTS = [
@@ -41,7 +112,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',    
+    'core.middleware.StaticFilesMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,7 +125,28 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Сколько SQL-запросов может выполнить view. Превышение и повтор одного
+# запроса QUERY_REPEAT_LIMIT раз (признак N+1) пишутся в лог, а при
+# QUERY_BUDGET_STRICT = True — приводят к исключению.
+QUERY_BUDGETS = {
+    'posts:posts_list': 4,
+    'posts:group_list': 4,
+    'posts:profile': 5,
+    'posts:post_detail': 4,
+    'posts:post_comments': 2,
+    'posts:post_create': 11,
+    'posts:post_edit': 9,
+    'posts:add_comment': 6,
+    'posts:follow_index': 7,
+    'posts:profile_follow': 16,
+    'posts:profile_unfollow': 12,
+    'posts:search': 4,
+}
+QUERY_REPEAT_LIMIT: int = 3
+QUERY_BUDGET_STRICT: bool = False
+
 ROOT_URLCONF = 'yatube.urls'
+TEST_RUNNER = 'core.testing.TestRunner'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
@@ -107,10 +202,57 @@ USE_L10N = True
 USE_TZ = True
 
 STATIC_URL = '/static/'
+# collectstatic собирает сюда файлы с хэшами в именах, манифест и
+# gzip-копии (core.staticfiles), а отдаёт их StaticFilesMiddleware.
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+# Какие файлы сжимать и начиная с какого размера (в байтах).
+STATIC_GZIP_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.ico', '.txt')
+STATIC_GZIP_MIN_SIZE: int = 1024
+# Сколько секунд кэшировать статику без хэша в имени.
+STATIC_MAX_AGE: int = 60 * 60
+
+# Полнотекстовый поиск (posts.search): сколько слов запроса учитывать,
+# с какой длины искать слово как префикс, сколько самых новых совпадений
+# ранжировать и вес совпадения в комментарии относительно текста поста.
+SEARCH_MAX_WORDS: int = 8
+SEARCH_PREFIX_MIN_LENGTH: int = 4
+SEARCH_MAX_RESULTS: int = 1000
+SEARCH_COMMENT_WEIGHT: float = 0.5
 
+# Списки админки (posts.admin): до какого числа считать строки, сколько
+# секунд хранить посчитанное и закэшированный список групп.
+ADMIN_COUNT_LIMIT: int = 100_000
+ADMIN_COUNT_TIMEOUT: int = 60
+ADMIN_CHOICES_TIMEOUT: int = 60 * 60
+
+# Сжатие ответов (core.middleware.CompressionMiddleware): какие типы
+# сжимать, с какого размера (в байтах) и убирать ли отступы в HTML.
+COMPRESS_CONTENT_TYPES = (
+    'text/', 'application/json', 'application/javascript',
+    'application/xml', 'image/svg+xml',
+)
+COMPRESS_MIN_SIZE: int = 200
+HTML_MINIFY: bool = True
+
+# Общий для всех процессов кэш (SQLite) с небольшим LRU в памяти
+# каждого процесса, см. core.tiered_cache. Тесты получают свой файл
+# во временном каталоге (core.testing.test_settings).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.tiered_cache.TieredCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            'SYNC_INTERVAL': 0.5,
+            # Счётчики core.metrics не нужны в L1 и не должны будить
+            # синхронизацию остальных процессов.
+            'UNLOGGED_PREFIXES': ['metrics:'],
+        },
     }
 }
 
+# Как часто (в секундах) накопленные в процессе счётчики сбрасываются в кэш.
+METRICS_FLUSH_INTERVAL = 10
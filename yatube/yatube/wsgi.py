@@ -4,3 +4,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.WARM_CACHE_ON_STARTUP:
+    # Процесс не отдаёт application серверу, пока кэш не прогрет.
+    from django.core.management import call_command  # noqa: E402
+
+    call_command('warm_cache')